@@ -1,12 +1,30 @@
 import os
+import json
 import logging
+import hashlib
 import time
-import publicmeta
+import tempfile
+import itertools
+import threading
+from multiprocessing.pool import ThreadPool
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows: part files aren't locked
+try:
+    # As part of the apkfetch package
+    from . import publicmeta, pagearchive, patching
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import publicmeta
+    import pagearchive
+    import patching
 
-from googleplay_api.googleplay import GooglePlayAPI,LoginError
+from googleplay_api.googleplay import GooglePlayAPI,LoginError,RequestError
+from googleplay_api import metrics
 
 api = None
-def init_api(acct_email, acct_password, gsf, auth_sub_token=None, max_attempts=15, cooldown_secs=10):
+def init_api(acct_email, acct_password, gsf, auth_sub_token=None, max_attempts=15, cooldown_secs=10, validators=None):
     global api
     assert max_attempts > 0, 'max_attempts was %d, must be greater than 0' % max_attempts
     assert cooldown_secs > 0, 'cooldown_secs was %d, must be greater than 0' % cooldown_secs
@@ -18,7 +36,7 @@ def init_api(acct_email, acct_password, gsf, auth_sub_token=None, max_attempts=1
         assert gsf is not None, 'Google Services Framework ID is required'
 
         # Authenticate the API, keep trying until it works
-        api = GooglePlayAPI(androidId=gsf)
+        api = GooglePlayAPI(androidId=gsf, validators=validators)
 
         for attempt in range(max(1, max_attempts)):
             attempt = attempt + 1
@@ -28,6 +46,7 @@ def init_api(acct_email, acct_password, gsf, auth_sub_token=None, max_attempts=1
                 return
             except LoginError as e:
                 logging.warning('BadAuthentication on attempt %d/%d' % (attempt, max_attempts))
+                metrics.REGISTRY.inc('auth_retries_total')
 
                 if(attempt == max_attempts):
                     raise e
@@ -35,7 +54,7 @@ def init_api(acct_email, acct_password, gsf, auth_sub_token=None, max_attempts=1
                 logging.warning('Retrying authentication in %d seconds' % cooldown_secs)
                 time.sleep(cooldown_secs)
 
-def get_metadata(package):
+def get_metadata(package, archive=None, validators=None):
     # Ensure the API is set
     global api
     assert api is not None, 'Need to call init_api() before attempting to get info about an APK'
@@ -45,12 +64,36 @@ def get_metadata(package):
     metadata = api.toDict(metadata)
 
     # Get info about the app (public)
-    metadata['public-meta'] = get_public_metadata(package)
+    metadata['public-meta'] = get_public_metadata(package, archive=archive, validators=validators)
 
     return metadata
 
-def get_public_metadata(package):
-    app_page = publicmeta.get_app_page(package)
+def get_public_metadata(package, archive=None, replay=False, validators=None):
+    # With an archive, either capture the fetched page into it or (replay) read it back offline
+    if(replay):
+        assert archive is not None, 'Replay mode requires an archive'
+        app_page = publicmeta.load_app_page(package, archive)
+        return extract_public_metadata(app_page)
+
+    if(validators is None):
+        app_page = publicmeta.get_app_page(package, archive=archive)
+        return extract_public_metadata(app_page)
+
+    # Conditional fetch: an unchanged page reuses the record extracted last time
+    (content, changed) = publicmeta.fetch_app_page(package, archive=archive, validators=validators)
+    url = publicmeta._base_url % package
+    if(not changed):
+        metadata = validators.record(url)
+        if(metadata is not None):
+            metrics.REGISTRY.inc('cache_hits_total', cache='public_meta')
+            return metadata
+
+    metadata = extract_public_metadata(publicmeta.parse_app_page(content))
+    validators.setRecord(url, metadata)
+
+    return metadata
+
+def extract_public_metadata(app_page):
     metadata = { \
         'iap' : publicmeta.has_iap(app_page), \
         'devSite' : publicmeta.get_dev_website(app_page), \
@@ -68,26 +111,395 @@ def get_public_metadata(package):
 
     return metadata
 
-def get_apk(package, version_code=None, outdir=None):
+def replay_public_metadata(archive_dir, package=None):
+    # Re-extract public metadata for the latest capture of every archived package; pages that
+    # can't be parsed or extracted (layout changes, truncated captures) are logged and skipped
+    archive = pagearchive.PageArchive(archive_dir)
+    latest = archive.latest(package)
+
+    for pkg in sorted(latest):
+        (fetch_time, digest) = latest[pkg]
+        try:
+            metadata = extract_public_metadata(publicmeta.parse_app_page(archive.get(digest)))
+        except Exception as e:
+            logging.warning('Skipping archived page %s of %s: %s: %s' % (digest, pkg, type(e).__name__, e))
+            continue
+        yield (pkg, fetch_time, metadata)
+
+def bulk_details(packages, batch_size=100, pool=None, client=None):
+    # Yields (package, DocV2 or None when unlisted) for every package in input order, looked up
+    # batch_size packages per bulkDetails request; with a pool, several requests are in flight.
+    # client defaults to the API set up by init_api()
+    client = client or api
+    assert client is not None, 'Need to call init_api() before attempting to get info about an APK'
+    assert batch_size > 0, 'batch_size was %d, must be greater than 0' % batch_size
+
+    packages = list(packages)
+    batches = [packages[start:start + batch_size] for start in range(0, len(packages), batch_size)]
+    responses = pool.imap(client.bulkDetails, batches) if pool is not None else (client.bulkDetails(batch) for batch in batches)
+    for (batch, response) in zip(batches, responses):
+        for (package, entry) in zip(batch, response.entry):
+            yield (package, entry.doc if entry.HasField('doc') else None)
+
+def get_version_codes(packages, batch_size=100, pool=None):
+    # Cheap version lookup through bulkDetails: {package: (versionCode, offerType)} for every listed app
+    versions = {}
+    for (package, doc) in bulk_details(packages, batch_size, pool):
+        if(doc is not None):
+            offer_type = doc.offer[0].offerType if len(doc.offer) > 0 else 1
+            versions[package] = (doc.details.appDetails.versionCode, offer_type)
+
+    return versions
+
+def _flat_path(package, version_code, outdir=None):
+    # <packagename>-<versioncode>.apk in outdir
+    filename = '%s-%d.apk' % (package, version_code)
+    return os.path.join(outdir, filename) if outdir is not None else filename
+
+def _apk_path(package, version_code, outdir=None, store=None):
+    # Where this version is already held, or None
+    if(store is not None):
+        return store.path(package, version_code)
+
+    filepath = _flat_path(package, version_code, outdir)
+    return filepath if os.path.exists(filepath) else None
+
+def get_missing_apks(packages, outdir=None, store=None):
+    # [(package, versionCode, offerType)] of the current versions not held yet, from one bulkDetails call per batch
+    packages = list(packages) # iterated twice, so a generator or file would be used up
+    versions = get_version_codes(packages)
+    missing = []
+    for package in packages:
+        if(package not in versions):
+            logging.warning('Store listing unavailable for %s' % package)
+            continue
+
+        (version_code, offer_type) = versions[package]
+        if(_apk_path(package, version_code, outdir, store) is None):
+            missing.append((package, version_code, offer_type))
+
+    return missing
+
+def _base_apk(package, version_code, outdir=None, store=None):
+    # (version_code, path) of the newest held version older than version_code, or None
+    if(store is not None):
+        for base_version in store.versions(package):
+            if(base_version < version_code and store.path(package, base_version) is not None):
+                return (base_version, store.path(package, base_version))
+        return None
+
+    directory = outdir if outdir is not None else '.'
+    for base_version in sorted(_held_versions(directory).get(package, ()), reverse=True):
+        path = os.path.join(directory, '%s-%d.apk' % (package, base_version))
+        if(base_version < version_code and os.path.exists(path)):
+            return (base_version, path)
+    return None
+
+# {outdir: {package: set(version codes)}} of the <package>-<versioncode>.apk files in flat
+# output directories, listed once per run and kept up to date as APKs are saved
+_outdir_index = {}
+_outdir_lock = threading.Lock()
+
+def _held_versions(directory):
+    directory = os.path.abspath(directory)
+    with _outdir_lock:
+        if(directory not in _outdir_index):
+            index = {}
+            for filename in os.listdir(directory):
+                if(not filename.endswith('.apk') or '-' not in filename):
+                    continue
+                (package, version) = filename[:-len('.apk')].rsplit('-', 1)
+                if(version.isdigit()):
+                    index.setdefault(package, set()).add(int(version))
+            _outdir_index[directory] = index
+
+        return _outdir_index[directory]
+
+def _add_held_version(directory, package, version_code):
+    directory = os.path.abspath(directory)
+    with _outdir_lock:
+        if(directory in _outdir_index):
+            _outdir_index[directory].setdefault(package, set()).add(version_code)
+
+def _save(package, version_code, chunks, outdir=None, store=None):
+    # Saves an APK from chunks that can't be resumed (rebuilt from a patch); downloads go
+    # through fetch_resumable() instead. With an ApkStore, keep the app in its
+    # content-addressed tree instead of outdir
+    if(store is not None):
+        store.put_stream(package, version_code, chunks)
+        return store.path(package, version_code)
+
+    # Otherwise as <packagename>-<versioncode>.apk, through a temp file that is only
+    # renamed into place once the download has passed verification
+    filepath = _flat_path(package, version_code, outdir)
+    fd, tmp_path = tempfile.mkstemp(dir=outdir or '.', prefix=os.path.basename(filepath) + '.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        os.rename(tmp_path, filepath)
+    finally:
+        if(os.path.exists(tmp_path)):
+            os.remove(tmp_path)
+
+    _add_held_version(outdir or '.', package, version_code)
+    return filepath
+
+# AppFileMetadata.fileType of expansion files
+OBB_TYPES = {0: 'main', 1: 'patch'}
+
+def obb_filename(package, file_metadata):
+    # The name Android expects in Android/obb/<package>/
+    return '%s.%d.%s.obb' % (OBB_TYPES.get(file_metadata.fileType, 'main'), file_metadata.versionCode, package)
+
+def _additional_files_dir(package, outdir=None, store=None):
+    if(store is not None):
+        return store.obb_dir(package)
+    return outdir if outdir is not None else '.'
+
+def _manifest_path(package, version_code, outdir=None, store=None):
+    return os.path.join(_additional_files_dir(package, outdir, store), '%s-%d.obb.json' % (package, version_code))
+
+class _LockedPart(object):
+    # The part file of a download, opened for appending and locked for the duration, so that
+    # concurrent fetches of one file (daemon jobs, pool threads, other processes) take turns
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        while True:
+            self.f = open(self.path, 'ab')
+            if(fcntl is None):
+                return self.f
+
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+            # Whoever held the lock before may have renamed the file into place meanwhile
+            try:
+                if(os.fstat(self.f.fileno()).st_ino == os.stat(self.path).st_ino):
+                    return self.f
+            except OSError:
+                pass
+            self.f.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.f.close()
+
+    def discard(self):
+        # Removes the part file while still holding the lock; waiters notice and start over
+        if(os.path.exists(self.path)):
+            os.remove(self.path)
+
+def _file_chunks(path, size, chunk_size=1 << 20):
+    # The first size bytes of path
+    with open(path, 'rb') as f:
+        while size > 0:
+            chunk = f.read(min(size, chunk_size))
+            if(not chunk):
+                return
+            size -= len(chunk)
+            yield chunk
+
+def _resume(part, url, cookies, size, signature, name, attempts):
+    # Completes the locked part file from url, resuming with a Range request after whatever
+    # it already holds. The whole file, old bytes and new, is verified against size and
+    # signature; data that fails verification is thrown away and fetched again. Returns the
+    # SHA-256 and size of the completed file, hashed as it streams by, so that only the
+    # resumed prefix is ever read back from disk.
+    f = part.f
+    for attempt in range(1, attempts + 1):
+        f.flush()
+        offset = os.fstat(f.fileno()).st_size
+        if(size is not None and offset > size):
+            f.truncate(0)
+            offset = 0
+
+        try:
+            chunks = _file_chunks(part.path, offset)
+            if(size is None or offset < size):
+                chunks = itertools.chain(chunks, api.streamUrl(url, cookies, offset=offset))
+            skip = offset
+            sha256 = hashlib.sha256()
+            for chunk in api.verifyStream(chunks, size, signature, name):
+                sha256.update(chunk)
+                if(skip > 0):
+                    (held, chunk) = (chunk[:skip], chunk[skip:])
+                    skip -= len(held)
+                f.write(chunk)
+            f.flush()
+            return (sha256.hexdigest(), os.fstat(f.fileno()).st_size)
+        except RequestError as e:
+            f.truncate(0)
+            if(attempt == attempts):
+                part.discard()
+                raise
+            logging.warning('%s failed verification (%s), fetching it again' % (name, e))
+        except IOError as e:
+            if(attempt == attempts):
+                raise
+            f.flush()
+            logging.warning('Fetching %s broke off after %d bytes (%s), resuming' % (name, os.fstat(f.fileno()).st_size, e))
+
+def fetch_resumable(url, cookies, filepath, size=None, signature=None, attempts=3):
+    # Streams url to filepath through filepath.part, verified against size and signature
+    # (either may be None). The part file is kept when the transfer breaks off, so that the
+    # next attempt (or run) resumes from where it stopped; it is only renamed into place
+    # once verified. A filepath that already exists with the expected size is kept.
+    done = lambda: os.path.exists(filepath) and (size is None or os.path.getsize(filepath) == size)
+    if(done()):
+        return filepath
+
+    part = _LockedPart(filepath + '.part')
+    with part:
+        if(done()):
+            # Another fetch of the same file finished while we waited for the lock
+            part.discard()
+            return filepath
+
+        _resume(part, url, cookies, size, signature, os.path.basename(filepath), attempts)
+        os.rename(part.path, filepath)
+
+    return filepath
+
+def _fetch_into_store(url, cookies, package, version_code, store, size=None, signature=None, attempts=3):
+    # fetch_resumable() for an ApkStore: the part file lives in its tmp directory and is
+    # moved into the content-addressed tree once verified
+    part = _LockedPart(os.path.join(store.tmp_dir, '%s-%d.apk.part' % (package, version_code)))
+    with part:
+        filepath = store.path(package, version_code)
+        if(filepath is not None):
+            part.discard()
+            return filepath
+
+        (digest, size) = _resume(part, url, cookies, size, signature, package, attempts)
+        store.put_tmp_file(package, version_code, part.path, digest, size)
+
+    return store.path(package, version_code)
+
+def _fetch_additional_files(package, version_code, delivery, outdir=None, store=None):
+    # Starts fetching every expansion file of a delivery in the background; returns the
+    # pool's AsyncResult of [(file_metadata, path)]
+    directory = _additional_files_dir(package, outdir, store)
+    cookies = api.deliveryCookies(delivery)
+
+    def fetch(file_metadata):
+        filepath = os.path.join(directory, obb_filename(package, file_metadata))
+        size = file_metadata.size if file_metadata.HasField('size') else None
+        if(os.path.exists(filepath) and (size is None or os.path.getsize(filepath) == size)):
+            metrics.REGISTRY.inc('cache_hits_total', cache='additional_file')
+        else:
+            metrics.REGISTRY.inc('cache_misses_total', cache='additional_file')
+        # AppFileMetadata carries no signature, so expansion files are checked by size only
+        return (file_metadata, fetch_resumable(file_metadata.downloadUrl, cookies, filepath, size))
+
+    pool = ThreadPool(len(delivery.additionalFile))
+    result = pool.map_async(fetch, list(delivery.additionalFile))
+    pool.close()
+    return (pool, result)
+
+def _write_manifest(package, version_code, apk_path, files, outdir=None, store=None):
+    manifest = {
+        'package': package,
+        'versionCode': version_code,
+        'apk': apk_path,
+        'additionalFiles': [{'type': OBB_TYPES.get(file_metadata.fileType, 'main'),
+                             'versionCode': file_metadata.versionCode,
+                             'size': os.path.getsize(path),
+                             'path': path} for (file_metadata, path) in files],
+    }
+
+    manifest_path = _manifest_path(package, version_code, outdir, store)
+    with open(manifest_path + '.part', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.rename(manifest_path + '.part', manifest_path)
+
+    return manifest_path
+
+def _download_apk(package, version_code, delivery, base=None, outdir=None, store=None):
+    if(base is not None and delivery.HasField('patchData')):
+        patch = delivery.patchData
+        try:
+            if(patch.baseVersionCode != base[0]):
+                raise patching.PatchError('Patch is against version %d, not the held %d' % (patch.baseVersionCode, base[0]))
+            # Before fetching anything, make sure the held base is what the store diffed against
+            patching.check_base(base[1], patch.baseSignature)
+
+            # The rebuilt APK is verified against the size and signature of the full one
+            patch_chunks = patching.limit_chunks(api.streamUrl(patch.downloadUrl, api.deliveryCookies(delivery)), patch.maxPatchSize)
+            chunks = patching.apply_patch(base[1], patch.patchFormat, patch_chunks)
+            filepath = _save(package, version_code, api.verifyDelivery(chunks, delivery, package), outdir, store)
+            metrics.REGISTRY.inc('delta_downloads_total', result='patched')
+            logging.info('Saved app to %s, patched from version %d' % (filepath, base[0]))
+            return filepath
+        except (RequestError, patching.PatchError, IOError) as e:
+            metrics.REGISTRY.inc('delta_downloads_total', result='fallback')
+            logging.warning('Patching %s from version %d failed (%s), downloading the full APK' % (package, base[0], e))
+
+    size = delivery.downloadSize if delivery.HasField('downloadSize') else None
+    signature = delivery.signature or None
+    cookies = api.deliveryCookies(delivery)
+    if(store is not None):
+        filepath = _fetch_into_store(delivery.downloadUrl, cookies, package, version_code, store, size, signature)
+    else:
+        filepath = fetch_resumable(delivery.downloadUrl, cookies, _flat_path(package, version_code, outdir), size, signature)
+        _add_held_version(outdir or '.', package, version_code)
+    logging.info('Saved app to %s' % filepath)
+    return filepath
+
+def download_result(package, versions, outdir=None, store=None, delta=False, additional_files=False):
+    # get_apk() for one of a batch of packages looked up with get_version_codes(), for pools
+    # and job queues: never raises, returns (package, path, None) or (package, None, error)
+    try:
+        assert package in versions, 'Store listing unavailable for %s' % package
+        (version_code, offer_type) = versions[package]
+        return (package, get_apk(package, version_code, outdir, store, offer_type, delta, additional_files), None)
+    except Exception as e:
+        logging.warning('%s failed with %s: %s' % (package, type(e).__name__, e))
+        return (package, None, '%s: %s' % (type(e).__name__, e))
+
+def get_apk(package, version_code=None, outdir=None, store=None, offer_type=1, delta=False, additional_files=False):
     # Ensure the output directory exists if it's specified
     assert outdir is None or os.path.isdir(outdir), 'Output directory %s does not exist' % outdir
 
-    # Get info about the app if no version code was provided
+    # Look up the current version if none was provided; bulkDetails skips the public page scrape
     if(version_code is None):
-        store_listing = get_metadata(package)
-        assert 'docV2' in store_listing, 'Store listing unavailable for %s' % package
-        store_listing = store_listing['docV2']
+        versions = get_version_codes([package])
+        assert package in versions, 'Store listing unavailable for %s' % package
+        (version_code, offer_type) = versions[package]
+        assert version_code > 0, 'Version code does not exist for %s' % package
 
-        assert 'details' in store_listing
-        assert 'appDetails' in store_listing['details'], 'App details unavailable for %s' % package
-        assert 'versionCode' in store_listing['details']['appDetails'], 'Version code does not exist for %s' % package
-        assert 'versionString' in store_listing['details']['appDetails'], 'Version string does not exist for %s' % package
-        version_code = store_listing['details']['appDetails']['versionCode']
+    # Skip the purchase and download entirely for versions we already hold
+    filepath = _apk_path(package, version_code, outdir, store)
+    if(filepath is not None and (not additional_files or os.path.exists(_manifest_path(package, version_code, outdir, store)))):
+        logging.info('%s version %d already stored at %s' % (package, version_code, filepath))
+        metrics.REGISTRY.inc('cache_hits_total', cache='apk')
+        return filepath
+    metrics.REGISTRY.inc('cache_misses_total', cache='apk')
 
-    # Download the app as <packagename>-<versioncode>.apk
-    filename = '%s-%d.apk' % (package, version_code)
-    filepath = os.path.join(outdir, filename) if outdir is not None else filename
-    with open(filepath, 'wb') as f:
-        f.write(api.download(package, version_code))
-    
-    logging.info('Saved app to %s' % filepath)
+    # In delta mode, advertise the newest older version we hold so the store can offer a patch
+    base = _base_apk(package, version_code, outdir, store) if delta else None
+    if(base is not None):
+        delivery = api.purchase(package, version_code, offer_type, base[0], patching.SUPPORTED_FORMATS)
+    else:
+        delivery = api.purchase(package, version_code, offer_type)
+
+    if(not additional_files):
+        return _download_apk(package, version_code, delivery, base, outdir, store)
+
+    # Expansion files are fetched alongside the APK (which may already be held), then listed in
+    # a manifest next to them; apps without any get an empty one, so they're skipped next time
+    files = []
+    if(len(delivery.additionalFile) > 0):
+        (pool, pending) = _fetch_additional_files(package, version_code, delivery, outdir, store)
+        try:
+            filepath = filepath or _download_apk(package, version_code, delivery, base, outdir, store)
+        finally:
+            pool.join()
+        files = pending.get()
+    else:
+        filepath = filepath or _download_apk(package, version_code, delivery, base, outdir, store)
+
+    manifest_path = _write_manifest(package, version_code, filepath, files, outdir, store)
+    logging.info('Saved %d additional files of %s, listed in %s' % (len(delivery.additionalFile), package, manifest_path))
+    return filepath
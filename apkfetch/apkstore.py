@@ -0,0 +1,150 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+
+# Content-addressed APK storage rooted at <root>:
+#   <root>/blobs/ab/cd/abcd....apk   APK bytes, named by their SHA-256
+#   <root>/tmp/                      in-flight downloads, renamed into blobs/ once complete
+#   <root>/index.sqlite              (package, versionCode) -> SHA-256
+#   <root>/obb/<package>/            expansion files (main.<vc>.<package>.obb) and their manifests
+# A blob is written at most once, however many (package, versionCode) pairs point at it.
+
+class ApkStore(object):
+    def __init__(self, root):
+        self.root = root
+        self.blobs_dir = os.path.join(root, 'blobs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+        for directory in (self.blobs_dir, self.tmp_dir):
+            if(not os.path.isdir(directory)):
+                os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS apks (' \
+                         'package TEXT NOT NULL, ' \
+                         'version_code INTEGER NOT NULL, ' \
+                         'sha256 TEXT NOT NULL, ' \
+                         'size INTEGER NOT NULL, ' \
+                         'stored_at INTEGER NOT NULL, ' \
+                         'PRIMARY KEY (package, version_code))')
+        self._db.execute('CREATE INDEX IF NOT EXISTS apks_sha256 ON apks (sha256)')
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def obb_dir(self, package):
+        # Expansion files aren't content-addressed: games name and look them up by type and version
+        directory = os.path.join(self.root, 'obb', package)
+        if(not os.path.isdir(directory)):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another writer created it first
+                if(not os.path.isdir(directory)):
+                    raise
+
+        return directory
+
+    def blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:4], '%s.apk' % digest)
+
+    def lookup(self, package, version_code):
+        # SHA-256 of the stored APK, or None if this version isn't held
+        with self._lock:
+            row = self._db.execute('SELECT sha256 FROM apks WHERE package = ? AND version_code = ?', (package, version_code)).fetchone()
+
+        if(row is None or not os.path.exists(self.blob_path(row[0]))):
+            return None
+
+        return row[0]
+
+    def has(self, package, version_code):
+        return self.lookup(package, version_code) is not None
+
+    def path(self, package, version_code):
+        digest = self.lookup(package, version_code)
+        return self.blob_path(digest) if digest is not None else None
+
+    def versions(self, package):
+        # Stored version codes of package, newest first
+        with self._lock:
+            rows = self._db.execute('SELECT version_code FROM apks WHERE package = ? ORDER BY version_code DESC', (package,)).fetchall()
+
+        return [row[0] for row in rows]
+
+    def put_stream(self, package, version_code, chunks):
+        # Hashes the chunks while writing them to a temp file, then moves the file into place
+        sha256 = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+
+            digest = sha256.hexdigest()
+            self._commit_blob(tmp_path, digest)
+        finally:
+            if(os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+        self._index(package, version_code, digest, size)
+        logging.info('Stored %s version %d as %s (%d bytes)' % (package, version_code, digest, size))
+
+        return digest
+
+    def put_tmp_file(self, package, version_code, tmp_path, digest, size):
+        # Stores a complete file from tmp_dir whose SHA-256 and size the caller computed while
+        # writing it, moving it into place instead of copying or reading it again
+        try:
+            self._commit_blob(tmp_path, digest)
+        finally:
+            if(os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+        self._index(package, version_code, digest, size)
+        logging.info('Stored %s version %d as %s (%d bytes)' % (package, version_code, digest, size))
+
+        return digest
+
+    def put_file(self, package, version_code, filepath):
+        # Adds an existing APK (e.g. from a flat output directory) without removing the original
+        def _chunks():
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    yield chunk
+
+        return self.put_stream(package, version_code, _chunks())
+
+    def _commit_blob(self, tmp_path, digest):
+        path = self.blob_path(digest)
+        if(os.path.exists(path)):
+            logging.debug('Blob %s already stored, discarding duplicate' % digest)
+            return
+
+        shard_dir = os.path.dirname(path)
+        if(not os.path.isdir(shard_dir)):
+            try:
+                os.makedirs(shard_dir)
+            except OSError:
+                # Another writer created it first
+                if(not os.path.isdir(shard_dir)):
+                    raise
+
+        os.rename(tmp_path, path)
+
+    def _index(self, package, version_code, digest, size):
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO apks (package, version_code, sha256, size, stored_at) VALUES (?, ?, ?, ?, ?)', \
+                                 (package, version_code, digest, size, int(time.time())))
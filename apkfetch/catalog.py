@@ -0,0 +1,194 @@
+import time
+import sqlite3
+import logging
+from datetime import datetime
+
+# SQLite catalog of the dicts returned by apkfetch.get_metadata(), normalized into
+# apps / versions / permissions / categories. Upserts are batched into transactions,
+# and re-storing a version the catalog already holds only touches the apps row if it changed.
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS apps (' \
+        'package TEXT PRIMARY KEY, ' \
+        'title TEXT, ' \
+        'developer TEXT, ' \
+        'dev_id TEXT, ' \
+        'num_downloads TEXT, ' \
+        'installs INTEGER, ' \
+        'free INTEGER, ' \
+        'latest_version_code INTEGER, ' \
+        'updated_at INTEGER NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS versions (' \
+        'package TEXT NOT NULL, ' \
+        'version_code INTEGER NOT NULL, ' \
+        'version_string TEXT, ' \
+        'upload_date TEXT, ' \
+        'upload_ts INTEGER, ' \
+        'installation_size INTEGER, ' \
+        'first_seen INTEGER NOT NULL, ' \
+        'PRIMARY KEY (package, version_code))',
+    'CREATE TABLE IF NOT EXISTS permissions (' \
+        'package TEXT NOT NULL, ' \
+        'version_code INTEGER NOT NULL, ' \
+        'permission TEXT NOT NULL, ' \
+        'PRIMARY KEY (package, version_code, permission))',
+    'CREATE TABLE IF NOT EXISTS categories (' \
+        'package TEXT NOT NULL, ' \
+        'category TEXT NOT NULL, ' \
+        'PRIMARY KEY (package, category))',
+    'CREATE INDEX IF NOT EXISTS apps_developer ON apps (developer)',
+    'CREATE INDEX IF NOT EXISTS apps_dev_id ON apps (dev_id)',
+    'CREATE INDEX IF NOT EXISTS versions_upload_ts ON versions (upload_ts)',
+    'CREATE INDEX IF NOT EXISTS permissions_permission ON permissions (permission)',
+    'CREATE INDEX IF NOT EXISTS categories_category ON categories (category)',
+]
+
+_epoch = datetime(1970, 1, 1)
+def parse_upload_date(upload_date):
+    # AppDetails.uploadDate is display text, e.g. "Mar 3, 2017"; returns a UTC timestamp or None
+    if(not upload_date):
+        return None
+
+    for date_format in ('%b %d, %Y', '%B %d, %Y', '%d %b %Y', '%Y-%m-%d'):
+        try:
+            return int((datetime.strptime(upload_date, date_format) - _epoch).total_seconds())
+        except ValueError:
+            pass
+
+    return None
+
+def flatten_metadata(metadata):
+    # Pulls the catalog columns out of a get_metadata() dict
+    doc = metadata.get('docV2', {})
+    app_details = doc.get('details', {}).get('appDetails', {})
+    public = metadata.get('public-meta') or {}
+
+    package = doc.get('docid') or app_details.get('packageName')
+    assert package is not None, 'Metadata has no package name'
+
+    upload_date = app_details.get('uploadDate')
+    free = public.get('free')
+
+    categories = set(app_details.get('appCategory', []))
+    categories.update(public.get('categories') or [])
+
+    return { \
+        'package': package, \
+        'title': doc.get('title') or app_details.get('title'), \
+        'developer': app_details.get('developerName') or doc.get('creator'), \
+        'dev_id': public.get('devId'), \
+        'num_downloads': app_details.get('numDownloads'), \
+        'installs': public.get('installs'), \
+        'free': None if free is None else int(free), \
+        'version_code': app_details.get('versionCode'), \
+        'version_string': app_details.get('versionString'), \
+        'upload_date': upload_date, \
+        'upload_ts': parse_upload_date(upload_date), \
+        'installation_size': app_details.get('installationSize'), \
+        'permissions': sorted(set(app_details.get('permission', []))), \
+        'categories': sorted(categories)
+    }
+
+class Catalog(object):
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def upsert(self, metadatas, batch_size=500):
+        # Stores get_metadata() dicts, batch_size per transaction; returns (apps changed, versions added)
+        assert batch_size > 0, 'batch_size was %d, must be greater than 0' % batch_size
+
+        apps_changed = 0
+        versions_added = 0
+        batch = []
+        for metadata in metadatas:
+            batch.append(flatten_metadata(metadata))
+            if(len(batch) >= batch_size):
+                (apps, versions) = self._upsert_batch(batch)
+                apps_changed += apps
+                versions_added += versions
+                batch = []
+
+        if(len(batch) > 0):
+            (apps, versions) = self._upsert_batch(batch)
+            apps_changed += apps
+            versions_added += versions
+
+        logging.info('Catalog upsert: %d apps changed, %d new versions' % (apps_changed, versions_added))
+        return (apps_changed, versions_added)
+
+    def _upsert_batch(self, rows):
+        now = int(time.time())
+        apps_changed = 0
+        versions_added = 0
+
+        with self._db:
+            for row in rows:
+                apps_changed += self._upsert_app(row, now)
+                versions_added += self._insert_version(row, now)
+                self._replace_categories(row)
+
+        return (apps_changed, versions_added)
+
+    def _upsert_app(self, row, now):
+        values = (row['title'], row['developer'], row['dev_id'], row['num_downloads'], row['installs'], row['free'], row['version_code'])
+
+        cursor = self._db.execute('INSERT OR IGNORE INTO apps (title, developer, dev_id, num_downloads, installs, free, latest_version_code, updated_at, package) ' \
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values + (now, row['package']))
+        if(cursor.rowcount > 0):
+            return 1
+
+        # Only rewrite the row (and bump updated_at) if something actually changed
+        cursor = self._db.execute('UPDATE apps SET title = ?, developer = ?, dev_id = ?, num_downloads = ?, installs = ?, free = ?, latest_version_code = ?, updated_at = ? ' \
+                                  'WHERE package = ? AND (title IS NOT ? OR developer IS NOT ? OR dev_id IS NOT ? OR num_downloads IS NOT ? ' \
+                                  'OR installs IS NOT ? OR free IS NOT ? OR latest_version_code IS NOT ?)', \
+                                  values + (now, row['package']) + values)
+        return cursor.rowcount
+
+    def _insert_version(self, row, now):
+        if(row['version_code'] is None):
+            return 0
+
+        cursor = self._db.execute('INSERT OR IGNORE INTO versions (package, version_code, version_string, upload_date, upload_ts, installation_size, first_seen) ' \
+                                  'VALUES (?, ?, ?, ?, ?, ?, ?)', \
+                                  (row['package'], row['version_code'], row['version_string'], row['upload_date'], row['upload_ts'], row['installation_size'], now))
+        if(cursor.rowcount == 0):
+            return 0    # Version already catalogued, nothing to do
+
+        self._db.executemany('INSERT OR IGNORE INTO permissions (package, version_code, permission) VALUES (?, ?, ?)', \
+                             [(row['package'], row['version_code'], permission) for permission in row['permissions']])
+        return 1
+
+    def _replace_categories(self, row):
+        existing = self._db.execute('SELECT category FROM categories WHERE package = ? ORDER BY category', (row['package'],)).fetchall()
+        if([category for (category,) in existing] == row['categories']):
+            return
+
+        self._db.execute('DELETE FROM categories WHERE package = ?', (row['package'],))
+        self._db.executemany('INSERT INTO categories (package, category) VALUES (?, ?)', \
+                             [(row['package'], category) for category in row['categories']])
+
+    def has_version(self, package, version_code):
+        row = self._db.execute('SELECT 1 FROM versions WHERE package = ? AND version_code = ?', (package, version_code)).fetchone()
+        return row is not None
+
+    def latest_version(self, package):
+        row = self._db.execute('SELECT MAX(version_code) FROM versions WHERE package = ?', (package,)).fetchone()
+        return row[0]
+
+    def packages_by_developer(self, developer):
+        rows = self._db.execute('SELECT package FROM apps WHERE developer = ? ORDER BY package', (developer,)).fetchall()
+        return [row[0] for row in rows]
+
+    def versions_uploaded_between(self, start_ts, end_ts):
+        # [(package, versionCode, uploadTimestamp)] uploaded in [start_ts, end_ts)
+        return self._db.execute('SELECT package, version_code, upload_ts FROM versions WHERE upload_ts >= ? AND upload_ts < ? ORDER BY upload_ts', \
+                                (start_ts, end_ts)).fetchall()
@@ -0,0 +1,255 @@
+import sys
+import code
+import logging
+import argparse
+from multiprocessing.pool import ThreadPool
+
+try:
+    # Python 2
+    import urlparse
+except ImportError:
+    # Python 3
+    import urllib.parse as urlparse
+
+try:
+    # As part of the apkfetch package
+    from . import apkfetch, apkstore, daemon
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import apkfetch
+    import apkstore
+    import daemon
+
+from googleplay_api import profiling
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.output import ResultWriter, FORMATS, RESULT_COLUMNS, resultRecord, resultRow, str_compat
+
+# Single entry point for the one-off scripts (search.py, list.py, download.py, permissions.py,
+# categories.py, apishell.py). Every subcommand that takes packages or queries also reads them
+# one per line from --input (- for stdin), logs in once, and works through the batch with a
+# pool of threads sharing the one authenticated API.
+
+def read_batch(items, input_path=None):
+    # Positional items first, then the lines of input_path; blank lines and # comments are skipped
+    batch = list(items)
+    if(input_path is not None):
+        f = sys.stdin if input_path == '-' else open(input_path)
+        try:
+            for line in f:
+                line = line.strip()
+                if(line and not line.startswith('#')):
+                    batch.append(line)
+        finally:
+            if(f is not sys.stdin):
+                f.close()
+
+    return batch
+
+def _bulk_docs(packages, workers):
+    # Yields (package, DocV2 or None) in input order, with up to workers bulkDetails requests in flight
+    pool = ThreadPool(workers)
+    try:
+        for result in apkfetch.bulk_details(packages, pool=pool):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def _write_results(writer, docs, extra=None):
+    for doc in docs:
+        if(writer.jsonl):
+            record = resultRecord(doc)
+            record.update(extra or {})
+            writer.writeRecord(record)
+        else:
+            writer.writeRow(resultRow(doc))
+
+def cmd_search(api, writer, args):
+    queries = read_batch(args.query, args.input)
+    search = lambda query: api.search(query, args.results, args.offset)
+
+    writer.writeHeader([label for (_, label) in RESULT_COLUMNS])
+    pool = ThreadPool(args.workers)
+    try:
+        for (query, message) in zip(queries, pool.imap(search, queries)):
+            if(len(message.doc) > 0):
+                _write_results(writer, message.doc[0].child, {'query': query})
+    finally:
+        pool.close()
+        pool.join()
+
+def cmd_list(api, writer, args):
+    # Batch lines are "category [subcategory]"
+    specs = [[args.category] + ([args.subcategory] if args.subcategory else [])] if args.category else []
+    specs += [line.split() for line in read_batch([], args.input)]
+    fetch = lambda spec: api.list(spec[0], spec[1] if len(spec) > 1 else None, args.results, args.offset)
+
+    pool = ThreadPool(args.workers)
+    try:
+        for (spec, message) in zip(specs, pool.imap(fetch, specs)):
+            if(len(spec) == 1):
+                writer.writeHeader(['Subcategory ID', 'Name'])
+                for doc in message.doc:
+                    if(writer.jsonl):
+                        writer.writeRecord({'category': spec[0], 'subcategory': doc.docid, 'name': doc.title})
+                    else:
+                        writer.writeRow([str_compat(doc.docid), str_compat(doc.title)])
+            else:
+                writer.writeHeader([label for (_, label) in RESULT_COLUMNS])
+                if(len(message.doc) > 0):
+                    _write_results(writer, message.doc[0].child, {'category': spec[0], 'subcategory': spec[1]})
+    finally:
+        pool.close()
+        pool.join()
+
+def cmd_categories(api, writer, args):
+    writer.writeHeader(['ID', 'Name'])
+    for c in api.browse().category:
+        category = urlparse.parse_qs(c.dataUrl)['cat'][0]
+        writer.write(['category', 'name'], [category, c.name])
+
+def cmd_details(api, writer, args):
+    writer.writeHeader([label for (_, label) in RESULT_COLUMNS])
+    for (package, doc) in _bulk_docs(read_batch(args.package, args.input), args.workers):
+        if(doc is None):
+            logging.warning('Store listing unavailable for %s' % package)
+            continue
+        _write_results(writer, [doc])
+
+def cmd_permissions(api, writer, args):
+    for (package, doc) in _bulk_docs(read_batch(args.package, args.input), args.workers):
+        if(doc is None):
+            logging.warning('Store listing unavailable for %s' % package)
+            continue
+        if(writer.jsonl):
+            writer.writeRecord({'packageName': doc.docid,
+                                'permissions': list(doc.details.appDetails.permission)})
+        else:
+            writer.writeRow([doc.docid + ':'])
+            for item in doc.details.appDetails.permission:
+                writer.writeRow(['    ' + str_compat(item)])
+            writer.writeRow([])
+
+def cmd_download(api, writer, args):
+    packages = read_batch(args.package, args.input)
+    store = None
+    if(args.store is not None):
+        store = apkstore.ApkStore(args.store)
+
+    failed = 0
+    writer.writeHeader(['Package name', 'Path', 'Error'])
+    pool = ThreadPool(args.workers)
+    try:
+        # Look up every current version in bulk up front instead of once per download
+        versions = apkfetch.get_version_codes(packages, pool=pool)
+        download = lambda package: apkfetch.download_result(package, versions, args.outdir, store, args.delta, args.additional_files)
+        for (package, path, error) in pool.imap_unordered(download, packages):
+            writer.write(['packageName', 'path', 'error'], [package, path or '', error or ''])
+            failed += error is not None
+    finally:
+        pool.close()
+        pool.join()
+        if(store is not None):
+            store.close()
+
+    return 1 if failed > 0 else 0
+
+def cmd_daemon(api, writer, args):
+    store = None
+    if(args.store is not None):
+        store = apkstore.ApkStore(args.store)
+
+    server = daemon.Daemon(args.outdir, store, args.workers)
+    try:
+        server.serve(args.host, args.port, args.socket)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+def cmd_shell(api, writer, args):
+    code.interact('Google Play Unofficial API Interactive Shell\n'
+                  'Successfully logged in using your Google account. The variable \'api\' holds the API object.',
+                  local={'api': api})
+
+def _batch_arguments(parser, name, help):
+    parser.add_argument(name, nargs='*', help=help)
+    parser.add_argument('-i', '--input', metavar='FILE', help='read more, one per line, from FILE (- for stdin)')
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='apkfetch', description='Search, browse and download apps from Google Play.')
+    parser.add_argument('--config', default='config.py', help='config file with the account and device (default: config.py)')
+    parser.add_argument('--format', choices=FORMATS, help='output format (default: OUTPUT_FORMAT from the config, or csv)')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='concurrent requests for batches (default: 8)')
+    parser.add_argument('--profile', nargs='?', const=profiling.DEFAULT_PATH, metavar='PATH', help='sample the run and write folded stacks to PATH')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log progress to stderr')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    p = commands.add_parser('search', help='search for apps')
+    _batch_arguments(p, 'query', 'search queries')
+    p.add_argument('-n', '--results', type=int, help='results per query')
+    p.add_argument('-o', '--offset', type=int)
+    p.set_defaults(run=cmd_search)
+
+    p = commands.add_parser('list', help='list subcategories, or the apps within one')
+    p.add_argument('category', nargs='?')
+    p.add_argument('subcategory', nargs='?')
+    p.add_argument('-i', '--input', metavar='FILE', help='read more "category [subcategory]" lines from FILE (- for stdin)')
+    p.add_argument('-n', '--results', type=int, help='results per list')
+    p.add_argument('-o', '--offset', type=int)
+    p.set_defaults(run=cmd_list)
+
+    p = commands.add_parser('categories', help='list the store categories')
+    p.set_defaults(run=cmd_categories)
+
+    p = commands.add_parser('details', help='show details of apps')
+    _batch_arguments(p, 'package', 'package names')
+    p.set_defaults(run=cmd_details)
+
+    p = commands.add_parser('permissions', help='show the permissions apps require')
+    _batch_arguments(p, 'package', 'package names')
+    p.set_defaults(run=cmd_permissions)
+
+    p = commands.add_parser('download', help='download the current version of apps')
+    _batch_arguments(p, 'package', 'package names')
+    p.add_argument('-d', '--outdir', help='directory for <package>-<versioncode>.apk files')
+    p.add_argument('-s', '--store', help='ApkStore directory to download into instead')
+    p.add_argument('--delta', action='store_true', help='fetch a patch against the newest older version held, when offered')
+    p.add_argument('--additional-files', action='store_true', help='also fetch expansion files (OBBs), listed in a manifest')
+    p.set_defaults(run=cmd_download)
+
+    p = commands.add_parser('daemon', help='stay resident and serve details, bulkDetails and download jobs over HTTP')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8766)
+    p.add_argument('--socket', metavar='PATH', help='listen on a Unix socket instead of host:port')
+    p.add_argument('-d', '--outdir', help='directory for <package>-<versioncode>.apk files')
+    p.add_argument('-s', '--store', help='ApkStore directory to download into instead')
+    p.set_defaults(run=cmd_daemon)
+
+    p = commands.add_parser('shell', help='interactive shell with a logged in api')
+    p.set_defaults(run=cmd_shell)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    if(args.profile is not None):
+        profiling.profileOnExit(args.profile)
+
+    # Log in once for the whole batch
+    config = GooglePlayAPI.read_config(args.config)
+    apkfetch.init_api(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['ANDROID_ID'], config['AUTH_TOKEN'])
+
+    writer = ResultWriter(args.format or config.get('OUTPUT_FORMAT', 'csv'), config.get('SEPARATOR', ';'))
+    try:
+        status = args.run(apkfetch.api, writer, args)
+    finally:
+        writer.flush()
+
+    return status or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
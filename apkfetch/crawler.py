@@ -0,0 +1,168 @@
+import os
+import io
+import sys
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    # Python 2
+    import urlparse
+except ImportError:
+    # Python 3
+    import urllib.parse as urlparse
+
+try:
+    # As part of the apkfetch package
+    from . import apkfetch
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import apkfetch
+
+from googleplay_api import profiling
+
+# Enumerates the store: browse() -> list(cat) -> every page of list(cat, ctr), several
+# subcategories at a time. Progress lives in <state_dir>:
+#   packages.txt   the deduplicated package universe, one package per line
+#   done.tsv       "<cat>\t<ctr>" for every fully crawled subcategory
+# Re-running with the same state_dir skips finished subcategories and known packages.
+
+def get_categories(api):
+    response = api.browse()
+    categories = []
+    for c in response.category:
+        query = urlparse.parse_qs(urlparse.urlparse(c.dataUrl).query or c.dataUrl)
+        if('cat' in query):
+            categories.append(query['cat'][0])
+
+    return categories
+
+def get_subcategories(api, cat):
+    response = api.list(cat)
+    return [doc.docid for doc in response.doc]
+
+def read_universe(path):
+    packages = []
+    if(os.path.exists(path)):
+        with io.open(path, 'r', encoding='utf-8') as f:
+            packages = [line.strip() for line in f if line.strip()]
+
+    return packages
+
+class CategoryCrawler(object):
+    def __init__(self, api, state_dir, workers=8, page_size=100):
+        assert workers > 0, 'workers was %d, must be greater than 0' % workers
+
+        self.api = api
+        self.state_dir = state_dir
+        self.workers = workers
+        self.page_size = page_size
+        self.universe_path = os.path.join(state_dir, 'packages.txt')
+        self.done_path = os.path.join(state_dir, 'done.tsv')
+
+        if(not os.path.isdir(state_dir)):
+            os.makedirs(state_dir)
+
+        self._lock = threading.Lock()
+        self.packages = set(read_universe(self.universe_path))
+        self.done = set()
+        if(os.path.exists(self.done_path)):
+            with io.open(self.done_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    fields = line.rstrip('\n').split('\t')
+                    if(len(fields) == 2):
+                        self.done.add((fields[0], fields[1]))
+
+        logging.info('Crawler state: %d packages, %d subcategories done' % (len(self.packages), len(self.done)))
+
+    def subcategory_pairs(self):
+        pairs = []
+        for cat in get_categories(self.api):
+            for ctr in get_subcategories(self.api, cat):
+                pairs.append((cat, ctr))
+
+        return pairs
+
+    def _record(self, new_packages):
+        # Dedup against everything seen so far and append the new ones to the universe
+        with self._lock:
+            fresh = [package for package in new_packages if package not in self.packages]
+            self.packages.update(fresh)
+            if(len(fresh) > 0):
+                with io.open(self.universe_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join('%s\n' % package for package in fresh))
+
+        return len(fresh)
+
+    def _checkpoint(self, pair):
+        with self._lock:
+            self.done.add(pair)
+            with io.open(self.done_path, 'a', encoding='utf-8') as f:
+                f.write('%s\t%s\n' % pair)
+
+    def crawl_subcategory(self, pair):
+        (cat, ctr) = pair
+        try:
+            batch = []
+            seen = 0
+            fresh = 0
+            for doc in self.api.listIter(cat, ctr, self.page_size):
+                batch.append(doc.docid)
+                seen += 1
+                if(len(batch) >= self.page_size):
+                    fresh += self._record(batch)
+                    batch = []
+            fresh += self._record(batch)
+
+            self._checkpoint(pair)
+            logging.info('Crawled %s/%s: %d apps, %d new' % (cat, ctr, seen, fresh))
+            return (pair, True)
+        except Exception as e:
+            # Left out of the checkpoint so the next run retries it
+            logging.warning('Crawling %s/%s failed: %s' % (cat, ctr, e))
+            return (pair, False)
+
+    def crawl(self):
+        # Returns the number of subcategories that failed (and will be retried on resume)
+        pairs = [pair for pair in self.subcategory_pairs() if pair not in self.done]
+        logging.info('Crawling %d subcategories with %d workers' % (len(pairs), self.workers))
+
+        failed = 0
+        pool = ThreadPool(self.workers)
+        try:
+            for (pair, ok) in pool.imap_unordered(self.crawl_subcategory, pairs):
+                if(not ok):
+                    failed += 1
+        finally:
+            pool.close()
+            pool.join()
+
+        logging.info('Package universe has %d packages (%d subcategories failed)' % (len(self.packages), failed))
+        return failed
+
+def crawl_store(state_dir, workers=8, page_size=100):
+    # Crawls with the API set up by apkfetch.init_api()
+    assert apkfetch.api is not None, 'Need to call init_api() before crawling'
+    crawler = CategoryCrawler(apkfetch.api, state_dir, workers, page_size)
+    crawler.crawl()
+
+    return crawler.universe_path
+
+def _main(argv):
+    argv = profiling.startProfile(argv)
+    if(len(argv) < 2):
+        print('Usage: %s state_dir [workers] [--profile[=path]]' % argv[0])
+        print('Enumerate every app in the store into state_dir/packages.txt, resuming from state_dir.')
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO)
+
+    from googleplay_api.googleplay import GooglePlayAPI
+    config = GooglePlayAPI.read_config()
+    apkfetch.init_api(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['ANDROID_ID'], config['AUTH_TOKEN'])
+
+    workers = int(argv[2]) if len(argv) >= 3 else 8
+    print(crawl_store(argv[1], workers))
+
+if __name__ == '__main__':
+    _main(sys.argv)
@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import base64
+import time
+import socket
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+    import urlparse
+except ImportError:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    import urllib.parse as urlparse
+
+try:
+    # As part of the apkfetch package
+    from . import apkfetch, apkstore
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import apkfetch
+    import apkstore
+
+from googleplay_api import metrics
+
+# Long-running mode for orchestration that would otherwise spawn download.py per job and pay
+# interpreter startup, the googleplay_pb2 import and a login every time. The daemon keeps the
+# logged-in API (with its connection pool), the ApkStore and a worker pool resident, and takes
+# jobs over HTTP on a TCP port or a Unix socket:
+#
+#   POST /details, /bulkDetails, /download  with {"packages": [...]} or ?package=a&package=b
+#   GET  /health, /metrics
+#
+# Job results are streamed back as JSON Lines, one object per package as soon as it is done.
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+class Daemon(object):
+    def __init__(self, outdir=None, store=None, workers=8, bulk_batch_size=100):
+        assert apkfetch.api is not None, 'Need to call init_api() before starting the daemon'
+        assert outdir is None or os.path.isdir(outdir), 'Output directory %s does not exist' % outdir
+
+        self.api = apkfetch.api
+        self.outdir = outdir
+        self.store = store
+        self.bulk_batch_size = bulk_batch_size
+        self.pool = ThreadPool(workers)
+        self.server = None
+        self.socket_path = None
+
+    # Jobs, each yielding one result dict per package
+
+    def details(self, packages):
+        def fetch(package):
+            try:
+                return {'package': package, 'details': self.api.toDict(self.api.details(package).docV2)}
+            except Exception as e:
+                return {'package': package, 'error': '%s: %s' % (type(e).__name__, e)}
+
+        return self.pool.imap(fetch, packages)
+
+    def bulk_details(self, packages):
+        for (package, doc) in apkfetch.bulk_details(packages, self.bulk_batch_size, self.pool, self.api):
+            if(doc is not None):
+                yield {'package': package, 'details': self.api.toDict(doc)}
+            else:
+                yield {'package': package, 'error': 'Store listing unavailable for %s' % package}
+
+    def download(self, packages):
+        versions = apkfetch.get_version_codes(packages, self.bulk_batch_size, self.pool)
+
+        def fetch(package):
+            (package, path, error) = apkfetch.download_result(package, versions, self.outdir, self.store)
+            if(error is not None):
+                return {'package': package, 'error': error}
+            return {'package': package, 'versionCode': versions[package][0], 'path': path}
+
+        return self.pool.imap_unordered(fetch, packages)
+
+    # Serving
+
+    def serve(self, host='127.0.0.1', port=8766, socket_path=None):
+        # Serves until shutdown(); with socket_path, on that Unix socket instead of host:port
+        handler = type(str('_BoundHandler'), (_Handler,), {'daemon': self})
+        if(socket_path is not None):
+            if(os.path.exists(socket_path)):
+                os.unlink(socket_path) # left over from a previous run
+            self.server = _ThreadingUnixHTTPServer(socket_path, handler)
+            self.socket_path = socket_path
+        else:
+            self.server = _ThreadingHTTPServer((host, port), handler)
+
+        logging.info('Daemon listening on %s' % self.address)
+        self.server.serve_forever()
+
+    def serve_in_background(self, host='127.0.0.1', port=0, socket_path=None):
+        thread = threading.Thread(target=self.serve, args=(host, port, socket_path))
+        thread.daemon = True
+        thread.start()
+
+        while self.server is None:
+            time.sleep(0.01)
+
+        return thread
+
+    @property
+    def address(self):
+        if(self.socket_path is not None):
+            return 'unix:%s' % self.socket_path
+
+        (host, port) = self.server.server_address[:2]
+        return 'http://%s:%d/' % (host, port)
+
+    def shutdown(self):
+        if(self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+        if(self.socket_path is not None and os.path.exists(self.socket_path)):
+            os.unlink(self.socket_path)
+        self.pool.close()
+        self.pool.join()
+        if(self.store is not None):
+            self.store.close()
+
+def _json_default(value):
+    # toDict() leaves repeated scalar fields as protobuf containers, and bytes fields as bytes
+    if(isinstance(value, bytes)):
+        return base64.b64encode(value).decode('ascii')
+    return list(value)
+
+class _Handler(BaseHTTPRequestHandler):
+    daemon = None
+    jobs = {'/details': 'details', '/bulkDetails': 'bulk_details', '/download': 'download'}
+
+    def log_message(self, format, *args):
+        # client_address is empty on a Unix socket, so the default would fail
+        logging.debug('daemon: ' + format % args)
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+    def do_GET(self):
+        path = urlparse.urlparse(self.path).path
+        if(path == '/health'):
+            self._send(200, json.dumps({'ok': True}).encode('utf-8'))
+        elif(path == '/metrics'):
+            body = metrics.PrometheusTextExporter().render(metrics.REGISTRY).encode('utf-8')
+            self._send(200, body, 'text/plain; version=0.0.4')
+        elif(path in self.jobs):
+            self._run_job(path)
+        else:
+            self._error(404, 'Unknown path %s' % path)
+
+    def do_POST(self):
+        self._run_job(urlparse.urlparse(self.path).path)
+
+    def _packages(self):
+        url = urlparse.urlparse(self.path)
+        packages = urlparse.parse_qs(url.query).get('package', [])
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if(length > 0):
+            body = json.loads(self.rfile.read(length).decode('utf-8'))
+            if(not isinstance(body, dict)):
+                raise ValueError('expected a JSON object, not %s' % type(body).__name__)
+            if(not isinstance(body.get('packages', []), list)):
+                raise ValueError('"packages" must be a list')
+            packages += body.get('packages', [])
+
+        return packages
+
+    def _run_job(self, path):
+        if(path not in self.jobs):
+            return self._error(404, 'Unknown path %s' % path)
+
+        try:
+            packages = self._packages()
+        except ValueError as e:
+            return self._error(400, 'Invalid request body: %s' % e)
+        if(len(packages) == 0):
+            return self._error(400, 'No packages given')
+
+        # No Content-Length: the results are streamed as they complete, and the end of
+        # the stream is the connection closing
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for result in getattr(self.daemon, self.jobs[path])(packages):
+                self.wfile.write((json.dumps(result, sort_keys=True, default=_json_default) + '\n').encode('utf-8'))
+        except socket.error:
+            logging.warning('Client went away during %s of %d packages' % (path, len(packages)))
+        except Exception as e:
+            # Headers are already out, so the failure goes into the stream
+            logging.exception('%s failed' % path)
+            self.wfile.write((json.dumps({'error': '%s: %s' % (type(e).__name__, e)}) + '\n').encode('utf-8'))
+
+def _main(argv):
+    if(len(argv) < 2):
+        print('Usage: %s (port|unix_socket_path) [outdir|store_dir] [workers]' % argv[0])
+        print('Keep a logged-in API resident and serve details, bulkDetails and download jobs.')
+        print('A store_dir is used as an ApkStore when it contains index.sqlite.')
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO)
+
+    from googleplay_api.googleplay import GooglePlayAPI
+    config = GooglePlayAPI.read_config()
+    apkfetch.init_api(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['ANDROID_ID'], config['AUTH_TOKEN'])
+
+    outdir = argv[2] if len(argv) >= 3 else None
+    store = None
+    if(outdir is not None and os.path.exists(os.path.join(outdir, 'index.sqlite'))):
+        (outdir, store) = (None, apkstore.ApkStore(outdir))
+    workers = int(argv[3]) if len(argv) >= 4 else 8
+
+    daemon = Daemon(outdir, store, workers)
+    try:
+        if(argv[1].isdigit()):
+            daemon.serve(port=int(argv[1]))
+        else:
+            daemon.serve(socket_path=argv[1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+
+if __name__ == '__main__':
+    _main(sys.argv)
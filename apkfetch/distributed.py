@@ -0,0 +1,236 @@
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import multiprocessing
+
+try:
+    # Python 2
+    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    from SocketServer import ThreadingMixIn
+    from xmlrpclib import ServerProxy
+except ImportError:
+    # Python 3
+    from xmlrpc.server import SimpleXMLRPCServer
+    from socketserver import ThreadingMixIn
+    from xmlrpc.client import ServerProxy
+
+try:
+    # As part of the apkfetch package
+    from . import jobs, apkfetch, apkstore
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import jobs
+    import apkfetch
+    import apkstore
+
+from googleplay_api import profiling
+
+# Coordinator/worker mode for running apkfetch across many hosts. The coordinator owns a
+# jobs.WorkLog and leases batches of packages to workers over XML-RPC; a lease expires when
+# its worker stops heartbeating for lease_secs, and the packages go back to pending for
+# another worker. Workers report each result back, so the work log stays the single record
+# of progress and the coordinator can itself be restarted without losing any.
+
+class _ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+class Coordinator(object):
+    def __init__(self, log_path, lease_secs=600, attempt_limits=None, default_attempts=3):
+        self.worklog = jobs.WorkLog(log_path)
+        self.lease_secs = lease_secs
+        self.attempt_limits = dict(jobs.DEFAULT_ATTEMPT_LIMITS)
+        self.attempt_limits.update(attempt_limits or {})
+        self.default_attempts = default_attempts
+        self.server = None
+
+    # RPC methods
+
+    def lease(self, worker_id, count):
+        # Expired leases are reassigned before handing out new work
+        expired = self.worklog.requeue_stale(self.lease_secs)
+        if(expired > 0):
+            logging.warning('Reassigning %d packages from expired leases' % expired)
+
+        packages = self.worklog.claim(worker_id, count)
+        if(len(packages) > 0):
+            logging.info('Leased %d packages to %s' % (len(packages), worker_id))
+
+        return packages
+
+    def heartbeat(self, worker_id, packages):
+        self.worklog.touch([package for package in packages if self.worklog.owner(package) == worker_id])
+        return True
+
+    def report(self, worker_id, results):
+        # results: [package, ok, error_class, error] lists
+        for (package, ok, error_class, error) in results:
+            if(ok):
+                self.worklog.complete(package)
+            elif(self.worklog.owner(package) == worker_id):
+                # Failures from a worker whose lease already moved on are ignored
+                max_attempts = self.attempt_limits.get(error_class, self.default_attempts)
+                self.worklog.fail(package, error_class, error, max_attempts)
+
+        return True
+
+    def stats(self):
+        return self.worklog.counts()
+
+    # Serving
+
+    def add(self, packages):
+        return self.worklog.add(packages)
+
+    def serve(self, host='0.0.0.0', port=8765):
+        # Binds and serves until shutdown(); port 0 picks a free one (see url)
+        self.server = _ThreadingXMLRPCServer((host, port), logRequests=False, allow_none=True)
+        for method in (self.lease, self.heartbeat, self.report, self.stats):
+            self.server.register_function(method)
+
+        logging.info('Coordinator listening on %s' % self.url)
+        self.server.serve_forever()
+
+    def serve_in_background(self, host='127.0.0.1', port=0):
+        thread = threading.Thread(target=self.serve, args=(host, port))
+        thread.daemon = True
+        thread.start()
+
+        while self.server is None:
+            time.sleep(0.01)
+
+        return thread
+
+    @property
+    def url(self):
+        (host, port) = self.server.server_address[:2]
+        if(host == '0.0.0.0'):
+            host = socket.gethostname()
+
+        return 'http://%s:%d/' % (host, port)
+
+    def shutdown(self):
+        if(self.server is not None):
+            self.server.shutdown()
+            self.server.server_close()
+        self.worklog.close()
+
+class _Heartbeat(object):
+    # Keeps the lease on a batch alive from a thread of its own, every interval seconds, however
+    # long a single package takes. It talks to the coordinator through its own proxy, as a
+    # ServerProxy can't be shared between threads.
+    def __init__(self, coordinator_url, worker_id, packages, interval):
+        self.coordinator = ServerProxy(coordinator_url, allow_none=True)
+        self.worker_id = worker_id
+        self.packages = packages
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='Heartbeat')
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.coordinator.heartbeat(self.worker_id, self.packages)
+            except Exception as e:
+                logging.warning('Heartbeat to the coordinator failed: %s' % e)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+def run_worker(coordinator_url, handler, worker_id=None, batch_size=10, poll_secs=5, lease_secs=600):
+    # Leases batches from the coordinator and runs handler(package) on each until no work is
+    # left, heartbeating every lease_secs / 3 (the coordinator's lease_secs) while it does
+    worker_id = worker_id or '%s-%d' % (socket.gethostname(), os.getpid())
+    coordinator = ServerProxy(coordinator_url, allow_none=True)
+    processed = 0
+
+    while True:
+        packages = coordinator.lease(worker_id, batch_size)
+        if(len(packages) == 0):
+            stats = coordinator.stats()
+            if(stats[jobs.PENDING] == 0 and stats[jobs.IN_PROGRESS] == 0):
+                break
+
+            # Others still hold leases that may expire back to pending
+            time.sleep(poll_secs)
+            continue
+
+        with _Heartbeat(coordinator_url, worker_id, packages, lease_secs / 3.0):
+            for package in packages:
+                try:
+                    handler(package)
+                    result = [package, True, None, None]
+                except Exception as e:
+                    logging.warning('%s failed with %s: %s' % (package, jobs.error_class(e), e))
+                    result = [package, False, jobs.error_class(e), str(e)]
+
+                coordinator.report(worker_id, [result])
+                processed += 1
+
+    logging.info('Worker %s finished after %d packages' % (worker_id, processed))
+    return processed
+
+def _run_local_worker(profile_path, *args):
+    # Samples the worker too when the run is profiled
+    profiling.profileWorker(profile_path)
+    return run_worker(*args)
+
+def run_local(log_path, packages, handler, workers=4, batch_size=10, lease_secs=600):
+    # Coordinator plus several worker processes on this machine; handler must be picklable
+    coordinator = Coordinator(log_path, lease_secs)
+    coordinator.add(packages)
+    coordinator.serve_in_background()
+
+    try:
+        args = (profiling.currentPath(), coordinator.url, handler, None, batch_size, 1, lease_secs)
+        processes = [multiprocessing.Process(target=_run_local_worker, args=args) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        return coordinator.stats()
+    finally:
+        coordinator.shutdown()
+
+_store = None
+def _download(package):
+    apkfetch.get_apk(package, store=_store)
+
+def _main(argv):
+    argv = profiling.startProfile(argv)
+    if(len(argv) < 3 or argv[1] not in ('coordinator', 'worker')):
+        print('Usage: %s coordinator worklog.sqlite [packages.txt] [port] [--profile[=path]]' % argv[0])
+        print('       %s worker coordinator_url store_dir [--profile[=path]]' % argv[0])
+        print('Coordinate apkfetch downloads across several hosts.')
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO)
+
+    if(argv[1] == 'coordinator'):
+        coordinator = Coordinator(argv[2])
+        if(len(argv) >= 4):
+            with open(argv[3]) as f:
+                coordinator.add([line.strip() for line in f if line.strip()])
+        port = int(argv[4]) if len(argv) >= 5 else 8765
+        coordinator.serve(port=port)
+    else:
+        global _store
+        from googleplay_api.googleplay import GooglePlayAPI
+
+        assert len(argv) >= 4, 'A store directory is required'
+        config = GooglePlayAPI.read_config()
+        apkfetch.init_api(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['ANDROID_ID'], config['AUTH_TOKEN'])
+        _store = apkstore.ApkStore(argv[3])
+        run_worker(argv[2], _download)
+
+if __name__ == '__main__':
+    _main(sys.argv)
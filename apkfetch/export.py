@@ -0,0 +1,180 @@
+import logging
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # Optional dependency, only needed for the columnar exporter
+    pyarrow = None
+
+# Columnar (Parquet or Arrow IPC) export of crawled metadata. Rows are buffered per column and
+# written one row group at a time, so memory stays bounded by row_group_size however many apps
+# are exported. Low-cardinality strings (developer, category) are dictionary-encoded.
+
+_COLUMNS = [
+    ('package', 'string'),
+    ('title', 'string'),
+    ('developer', 'dictionary'),
+    ('category', 'dictionary'),
+    ('super_dev', 'bool_'),
+    ('price', 'dictionary'),
+    ('offer_type', 'int32'),
+    ('version_code', 'int64'),
+    ('version_string', 'string'),
+    ('installation_size', 'int64'),
+    ('rating', 'float64'),
+    ('num_downloads', 'dictionary'),
+    ('upload_date', 'string'),
+    ('dev_id', 'string'),
+    ('dev_site', 'string'),
+    ('dev_email', 'string'),
+    ('iap', 'bool_'),
+    ('ads', 'bool_'),
+    ('free', 'bool_'),
+    ('family', 'bool_'),
+    ('installs', 'int64'),
+    ('publish_ts', 'int64'),
+]
+
+def _arrow_type(name):
+    if(name == 'dictionary'):
+        return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+
+    return getattr(pyarrow, name)()
+
+def _text(value):
+    # lxml extractors return utf-8 bytes on Python 2
+    if(isinstance(value, bytes)):
+        return value.decode('utf-8')
+    return value
+
+def _public_fields(row, public_meta):
+    if(not public_meta):
+        return row
+
+    categories = public_meta.get('categories') or []
+    row.update({ \
+        'category': row.get('category') or (_text(categories[0]) if len(categories) > 0 else None), \
+        'dev_id': _text(public_meta.get('devId')), \
+        'dev_site': _text(public_meta.get('devSite')), \
+        'dev_email': _text(public_meta.get('devEmail')), \
+        'iap': public_meta.get('iap'), \
+        'ads': public_meta.get('ads'), \
+        'free': public_meta.get('free'), \
+        'family': public_meta.get('family'), \
+        'installs': public_meta.get('installs'), \
+        'publish_ts': public_meta.get('publishTimestamp')
+    })
+    return row
+
+def docv2_row(doc, public_meta=None):
+    # Same fields as helpers.print_result_line, from a DocV2 protobuf (search/list/bulkDetails results)
+    app_details = doc.details.appDetails
+    offer = doc.offer[0] if len(doc.offer) > 0 else None
+
+    row = { \
+        'package': doc.docid, \
+        'title': doc.title, \
+        'developer': app_details.developerName or doc.creator, \
+        'category': app_details.appCategory[0] if len(app_details.appCategory) > 0 else None, \
+        'super_dev': len(doc.annotations.badgeForCreator) > 0, \
+        'price': offer.formattedAmount if offer is not None else None, \
+        'offer_type': offer.offerType if offer is not None else None, \
+        'version_code': app_details.versionCode, \
+        'version_string': app_details.versionString, \
+        'installation_size': app_details.installationSize, \
+        'rating': doc.aggregateRating.starRating, \
+        'num_downloads': app_details.numDownloads, \
+        'upload_date': app_details.uploadDate
+    }
+    return _public_fields(row, public_meta)
+
+def metadata_row(metadata):
+    # From an apkfetch.get_metadata() dict (toDict'ed DocV2 plus 'public-meta')
+    doc = metadata.get('docV2', {})
+    app_details = doc.get('details', {}).get('appDetails', {})
+    offers = doc.get('offer', [])
+    offer = offers[0] if len(offers) > 0 else {}
+    app_categories = app_details.get('appCategory', [])
+
+    row = { \
+        'package': doc.get('docid'), \
+        'title': doc.get('title'), \
+        'developer': app_details.get('developerName') or doc.get('creator'), \
+        'category': app_categories[0] if len(app_categories) > 0 else None, \
+        'super_dev': len(doc.get('annotations', {}).get('badgeForCreator', [])) > 0, \
+        'price': offer.get('formattedAmount'), \
+        'offer_type': offer.get('offerType'), \
+        'version_code': app_details.get('versionCode'), \
+        'version_string': app_details.get('versionString'), \
+        'installation_size': app_details.get('installationSize'), \
+        'rating': doc.get('aggregateRating', {}).get('starRating'), \
+        'num_downloads': app_details.get('numDownloads'), \
+        'upload_date': app_details.get('uploadDate')
+    }
+    return _public_fields(row, metadata.get('public-meta'))
+
+class ColumnarWriter(object):
+    def __init__(self, path, file_format='parquet', row_group_size=65536, compression='zstd'):
+        assert pyarrow is not None, 'pyarrow is required for columnar export (pip install pyarrow)'
+        assert file_format in ('parquet', 'arrow'), 'Unknown columnar format %s' % file_format
+        assert row_group_size > 0, 'row_group_size was %d, must be greater than 0' % row_group_size
+
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self.schema = pyarrow.schema([(name, _arrow_type(kind)) for (name, kind) in _COLUMNS])
+        self._columns = dict((name, []) for (name, _) in _COLUMNS)
+        self._buffered = 0
+
+        if(file_format == 'parquet'):
+            dictionary_columns = [name for (name, kind) in _COLUMNS if kind == 'dictionary']
+            self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression=compression, use_dictionary=dictionary_columns)
+            self._write_table = lambda table: self._writer.write_table(table, row_group_size=row_group_size)
+        else:
+            self._writer = pyarrow.ipc.new_file(path, self.schema)
+            self._write_table = self._writer.write_table
+
+    def write(self, row):
+        for (name, _) in _COLUMNS:
+            self._columns[name].append(row.get(name))
+
+        self._buffered += 1
+        if(self._buffered >= self.row_group_size):
+            self.flush()
+
+    def write_all(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self):
+        if(self._buffered == 0):
+            return
+
+        table = pyarrow.Table.from_pydict(self._columns, schema=self.schema)
+        self._write_table(table)
+        self.rows_written += self._buffered
+        logging.debug('Wrote row group of %d rows to %s' % (self._buffered, self.path))
+
+        self._columns = dict((name, []) for (name, _) in _COLUMNS)
+        self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        logging.info('Exported %d rows to %s' % (self.rows_written, self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def export_metadata(metadatas, path, **kwargs):
+    # Convenience wrapper: get_metadata() dicts -> columnar file
+    with ColumnarWriter(path, **kwargs) as writer:
+        for metadata in metadatas:
+            writer.write(metadata_row(metadata))
+
+    return writer.rows_written
@@ -0,0 +1,197 @@
+import os
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+
+try:
+    # As part of the apkfetch package
+    from . import apkfetch
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import apkfetch
+
+# Durable work log for long crawls. Every package is pending, in_progress, done or failed,
+# with its attempt count and the class of its last error, in a SQLite database that is
+# committed on every transition. A crashed run resumes exactly where it stopped: items it
+# left in_progress are re-queued on restart, as are items anyone left in_progress too long.
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+# Maximum attempts per error class; anything not listed gets default_attempts
+DEFAULT_ATTEMPT_LIMITS = { \
+    'AssertionError': 1,    # Listing unavailable, no version code, ...: retrying won't help
+    'RequestError/404': 1,  # Not found
+    'RequestError/429': 10, # Throttled: worth waiting out
+}
+
+def error_class(e):
+    # Class name of an exception, with the HTTP status for errors the server answered
+    status = getattr(e, 'status', None)
+    if(status is not None):
+        return '%s/%d' % (type(e).__name__, status)
+    return type(e).__name__
+
+class WorkLog(object):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS jobs (' \
+                         'package TEXT PRIMARY KEY, ' \
+                         'state TEXT NOT NULL, ' \
+                         'attempts INTEGER NOT NULL DEFAULT 0, ' \
+                         'error_class TEXT, ' \
+                         'error TEXT, ' \
+                         'owner TEXT, ' \
+                         'updated_at INTEGER NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, updated_at)')
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            with self._db:
+                return self._db.execute(sql, params).rowcount
+
+    def add(self, packages):
+        # Queues packages that aren't in the log yet; returns how many were new
+        now = int(time.time())
+        with self._lock:
+            with self._db:
+                before = self._db.total_changes
+                self._db.executemany('INSERT OR IGNORE INTO jobs (package, state, updated_at) VALUES (?, ?, ?)', \
+                                     ((package, PENDING, now) for package in packages))
+                return self._db.total_changes - before
+
+    def claim(self, owner, count=1):
+        # Atomically moves up to count pending packages to in_progress under owner
+        now = int(time.time())
+        with self._lock:
+            with self._db:
+                rows = self._db.execute('SELECT package FROM jobs WHERE state = ? ORDER BY updated_at, rowid LIMIT ?', (PENDING, count)).fetchall()
+                packages = [row[0] for row in rows]
+                self._db.executemany('UPDATE jobs SET state = ?, owner = ?, updated_at = ? WHERE package = ?', \
+                                     [(IN_PROGRESS, owner, now, package) for package in packages])
+
+        return packages
+
+    def touch(self, packages):
+        # Heartbeat for long-running items so requeue_stale() leaves them alone
+        now = int(time.time())
+        with self._lock:
+            with self._db:
+                self._db.executemany('UPDATE jobs SET updated_at = ? WHERE package = ? AND state = ?', \
+                                     [(now, package, IN_PROGRESS) for package in packages])
+
+    def complete(self, package):
+        return self._execute('UPDATE jobs SET state = ?, attempts = attempts + 1, error_class = NULL, error = NULL, owner = NULL, updated_at = ? WHERE package = ?', \
+                             (DONE, int(time.time()), package))
+
+    def fail(self, package, error_class, error, max_attempts):
+        # Records a failed attempt; the package goes back to pending until it reaches max_attempts
+        with self._lock:
+            with self._db:
+                row = self._db.execute('SELECT attempts FROM jobs WHERE package = ?', (package,)).fetchone()
+                attempts = (row[0] if row is not None else 0) + 1
+                state = PENDING if attempts < max_attempts else FAILED
+                self._db.execute('UPDATE jobs SET state = ?, attempts = ?, error_class = ?, error = ?, owner = NULL, updated_at = ? WHERE package = ?', \
+                                 (state, attempts, error_class, error, int(time.time()), package))
+
+        return state
+
+    def owner(self, package):
+        # Who holds package in_progress, or None
+        with self._lock:
+            row = self._db.execute('SELECT owner FROM jobs WHERE package = ? AND state = ?', (package, IN_PROGRESS)).fetchone()
+
+        return row[0] if row is not None else None
+
+    def requeue_stale(self, max_age_secs):
+        # Items left in_progress longer than max_age_secs (their worker is presumed dead)
+        cutoff = int(time.time()) - max_age_secs
+        return self._execute('UPDATE jobs SET state = ?, owner = NULL WHERE state = ? AND updated_at < ?', (PENDING, IN_PROGRESS, cutoff))
+
+    def requeue_owner(self, owner):
+        # Items a previous incarnation of owner left in_progress when it died
+        return self._execute('UPDATE jobs SET state = ?, owner = NULL WHERE state = ? AND owner = ?', (PENDING, IN_PROGRESS, owner))
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+
+        counts = dict((state, 0) for state in (PENDING, IN_PROGRESS, DONE, FAILED))
+        counts.update(dict(rows))
+        return counts
+
+    def failures(self):
+        # [(package, attempts, error_class, error)] of permanently failed items
+        with self._lock:
+            return self._db.execute('SELECT package, attempts, error_class, error FROM jobs WHERE state = ? ORDER BY package', (FAILED,)).fetchall()
+
+class JobRunner(object):
+    def __init__(self, worklog, handler, owner=None, workers=1, attempt_limits=None, default_attempts=3, stale_secs=3600):
+        assert workers > 0, 'workers was %d, must be greater than 0' % workers
+
+        self.worklog = worklog
+        self.handler = handler
+        self.owner = owner or '%s:%s' % (socket.gethostname(), os.path.abspath(worklog.path))
+        self.workers = workers
+        self.attempt_limits = dict(DEFAULT_ATTEMPT_LIMITS)
+        self.attempt_limits.update(attempt_limits or {})
+        self.default_attempts = default_attempts
+        self.stale_secs = stale_secs
+
+    def _run_one(self, package):
+        try:
+            self.handler(package)
+            self.worklog.complete(package)
+            return True
+        except Exception as e:
+            cls = error_class(e)
+            max_attempts = self.attempt_limits.get(cls, self.default_attempts)
+            state = self.worklog.fail(package, cls, str(e), max_attempts)
+            logging.warning('%s failed with %s: %s (%s)' % (package, cls, e, state))
+            return False
+
+    def run(self):
+        # Processes the log until nothing is pending; returns the final state counts
+        resumed = self.worklog.requeue_owner(self.owner) + self.worklog.requeue_stale(self.stale_secs)
+        if(resumed > 0):
+            logging.info('Re-queued %d interrupted items' % resumed)
+
+        pool = ThreadPool(self.workers)
+        try:
+            while True:
+                batch = self.worklog.claim(self.owner, self.workers * 4)
+                if(len(batch) == 0):
+                    break
+
+                pool.map(self._run_one, batch)
+
+                counts = self.worklog.counts()
+                logging.info('Progress: %d done, %d failed, %d pending' % (counts[DONE], counts[FAILED], counts[PENDING]))
+        finally:
+            pool.close()
+            pool.join()
+
+        return self.worklog.counts()
+
+def download_all(log_path, packages, outdir=None, store=None, workers=4):
+    # Downloads packages with apkfetch.get_apk() under a work log at log_path; safe to re-run after a crash
+    worklog = WorkLog(log_path)
+    try:
+        worklog.add(packages)
+        runner = JobRunner(worklog, lambda package: apkfetch.get_apk(package, outdir=outdir, store=store), workers=workers)
+        return runner.run()
+    finally:
+        worklog.close()
@@ -0,0 +1,86 @@
+import os
+import io
+import gzip
+import time
+import hashlib
+import logging
+import tempfile
+
+# On-disk layout of an archive rooted at <root>:
+#   <root>/objects/ab/abcdef....html.gz   gzip'd page, named by the SHA-256 of the raw HTML
+#   <root>/index.tsv                      one "<package>\t<fetch_time>\t<sha256>" line per capture
+# Identical pages captured at different times share a single object.
+
+class PageArchive(object):
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'index.tsv')
+
+        if(not os.path.isdir(self.objects_dir)):
+            os.makedirs(self.objects_dir)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], '%s.html.gz' % digest)
+
+    def put(self, package, content, fetch_time=None):
+        fetch_time = int(time.time()) if fetch_time is None else int(fetch_time)
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.object_path(digest)
+
+        if(not os.path.exists(path)):
+            shard_dir = os.path.dirname(path)
+            if(not os.path.isdir(shard_dir)):
+                os.makedirs(shard_dir)
+
+            # Write to a temp file first so a crash never leaves a truncated object behind
+            fd, tmp_path = tempfile.mkstemp(dir=shard_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                    f.write(content)
+            os.rename(tmp_path, path)
+
+        with io.open(self.index_path, 'ab') as f:
+            f.write(('%s\t%d\t%s\n' % (package, fetch_time, digest)).encode('utf-8'))
+
+        logging.debug('Archived page for package "%s" as %s' % (package, digest))
+        return digest
+
+    def get(self, digest):
+        with gzip.open(self.object_path(digest), 'rb') as f:
+            return f.read()
+
+    def entries(self, package=None):
+        # Yields (package, fetch_time, sha256) in capture order
+        if(not os.path.exists(self.index_path)):
+            return
+
+        with io.open(self.index_path, 'rb') as f:
+            for line in f:
+                fields = line.decode('utf-8').rstrip('\n').split('\t')
+                if(len(fields) != 3):
+                    continue
+
+                if(package is None or fields[0] == package):
+                    yield (fields[0], int(fields[1]), fields[2])
+
+    def latest(self, package=None):
+        # Most recent capture per package, as a {package: (fetch_time, sha256)} dict
+        latest = {}
+        for (pkg, fetch_time, digest) in self.entries(package):
+            if(pkg not in latest or fetch_time >= latest[pkg][0]):
+                latest[pkg] = (fetch_time, digest)
+
+        return latest
+
+    def lookup(self, package, fetch_time=None):
+        # Newest capture of package at or before fetch_time (or the newest overall)
+        found = None
+        for (_, captured, digest) in self.entries(package):
+            if(fetch_time is not None and captured > fetch_time):
+                continue
+            if(found is None or captured >= found[0]):
+                found = (captured, digest)
+
+        assert found is not None, 'No archived page for package "%s"' % package
+        return found
@@ -0,0 +1,153 @@
+import zlib
+import base64
+import struct
+import hashlib
+
+# Applies the patches the store serves for delta updates (AndroidAppDeliveryData.patchData) to
+# a stored base APK. Patch formats as numbered by the store:
+#   1  GDIFF (http://www.w3.org/TR/NOTE-gdiff-19970901)
+#   2  GDIFF, gzipped
+# The bsdiff and file-by-file formats (3 and up) aren't supported, so they are never advertised.
+
+GDIFF = 1
+GZIPPED_GDIFF = 2
+SUPPORTED_FORMATS = (GDIFF, GZIPPED_GDIFF)
+
+GDIFF_MAGIC = b'\xd1\xff\xd1\xff'
+GDIFF_VERSION = 4
+
+_OUTPUT_CHUNK = 1 << 16
+
+# COPY opcodes: (offset struct, length struct)
+_COPY = {
+    249: ('>H', '>B'),
+    250: ('>H', '>H'),
+    251: ('>H', '>i'),
+    252: ('>i', '>B'),
+    253: ('>i', '>H'),
+    254: ('>i', '>i'),
+    255: ('>q', '>i'),
+}
+
+class PatchError(Exception):
+    pass
+
+class _ChunkReader(object):
+    # read(n) over an iterator of byte strings, for parsing a patch as it downloads
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+        self.offset = 0
+
+    def read(self, size):
+        while len(self.buffer) - self.offset < size:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                raise PatchError('Patch ends %d bytes short' % (size - (len(self.buffer) - self.offset)))
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+def _normalize_signature(signature):
+    # Signatures come url-safe and unpadded; accept the standard alphabet too
+    return signature.replace('+', '-').replace('/', '_').rstrip('=')
+
+def check_base(base_path, base_signature):
+    # Raises PatchError unless base_path is the file the patch was made against (its
+    # AndroidAppPatchData.baseSignature, the base64 SHA-1); an empty signature isn't checked
+    if(not base_signature):
+        return
+
+    sha1 = hashlib.sha1()
+    with open(base_path, 'rb') as base:
+        for chunk in iter(lambda: base.read(_OUTPUT_CHUNK), b''):
+            sha1.update(chunk)
+    digest = base64.urlsafe_b64encode(sha1.digest()).decode('ascii')
+    if(_normalize_signature(digest) != _normalize_signature(base_signature)):
+        raise PatchError('Held base %s has SHA-1 %s, the patch is against %s' % (base_path, digest, base_signature))
+
+def limit_chunks(chunks, max_size):
+    # Passes chunks through, aborting the stream with PatchError once it exceeds max_size bytes
+    received = 0
+    try:
+        for chunk in chunks:
+            received += len(chunk)
+            if(max_size and received > max_size):
+                raise PatchError('Patch exceeds its maximum size of %d bytes' % max_size)
+            yield chunk
+    finally:
+        if(hasattr(chunks, 'close')):
+            chunks.close()
+
+def gunzip_chunks(chunks):
+    # Decompresses a gzip stream chunk by chunk
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        for chunk in chunks:
+            data = decompressor.decompress(chunk)
+            if(data):
+                yield data
+        data = decompressor.flush()
+    except zlib.error as e:
+        raise PatchError('Corrupt gzipped patch: %s' % e)
+
+    if(data):
+        yield data
+
+def apply_gdiff(base, patch_chunks):
+    # Yields the output of applying the GDIFF patch in patch_chunks to base, an open binary file
+    patch = _ChunkReader(patch_chunks)
+    if(patch.read(4) != GDIFF_MAGIC):
+        raise PatchError('Not a GDIFF patch')
+    version = patch.unpack('>B')
+    if(version != GDIFF_VERSION):
+        raise PatchError('Unsupported GDIFF version %d' % version)
+
+    while True:
+        op = patch.unpack('>B')
+        if(op == 0): # EOF
+            return
+
+        if(op <= 248): # DATA
+            if(op == 247):
+                length = patch.unpack('>H')
+            elif(op == 248):
+                length = patch.unpack('>i')
+            else:
+                length = op
+            while length > 0:
+                data = patch.read(min(length, _OUTPUT_CHUNK))
+                length -= len(data)
+                yield data
+        else: # COPY from base
+            (offset_fmt, length_fmt) = _COPY[op]
+            offset = patch.unpack(offset_fmt)
+            length = patch.unpack(length_fmt)
+            if(offset < 0 or length < 0):
+                raise PatchError('Invalid COPY of %d bytes at %d' % (length, offset))
+
+            base.seek(offset)
+            while length > 0:
+                data = base.read(min(length, _OUTPUT_CHUNK))
+                if(not data):
+                    raise PatchError('COPY past the end of the base file at %d' % offset)
+                length -= len(data)
+                yield data
+
+def apply_patch(base_path, patch_format, patch_chunks):
+    # Yields the chunks of the new APK rebuilt from base_path and a streamed patch
+    if(patch_format not in SUPPORTED_FORMATS):
+        raise PatchError('Unsupported patch format %d' % patch_format)
+    if(patch_format == GZIPPED_GDIFF):
+        patch_chunks = gunzip_chunks(patch_chunks)
+
+    with open(base_path, 'rb') as base:
+        for chunk in apply_gdiff(base, patch_chunks):
+            yield chunk
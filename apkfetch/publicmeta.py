@@ -5,17 +5,61 @@ import re
 import urllib
 from datetime import datetime
 
-def get_app_page(package_name, base_url='https://play.google.com/store/apps/details?id=%s&hl=en', user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'):
+from googleplay_api import metrics
+
+_base_url = 'https://play.google.com/store/apps/details?id=%s&hl=en'
+_user_agent = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_12_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+
+def get_app_page(package_name, base_url=_base_url, user_agent=_user_agent, archive=None, validators=None):
+    (content, changed) = fetch_app_page(package_name, base_url, user_agent, archive, validators)
+    tree = parse_app_page(content)
+    return tree
+
+def fetch_app_page(package_name, base_url=_base_url, user_agent=_user_agent, archive=None, validators=None):
+    # Returns (raw HTML, changed); changed is False when a ValidatorCache let the server answer 304
+    url = base_url % package_name
     headers = {'User-Agent': user_agent}
-    resp = requests.get(base_url % package_name, headers=headers)
+    if(validators is not None):
+        headers.update(validators.conditionalHeaders(url))
+
+    with metrics.REGISTRY.timer('request_latency_seconds', endpoint='store_page'):
+        resp = requests.get(url, headers=headers)
+
+    metrics.REGISTRY.inc('requests_total', endpoint='store_page', status=resp.status_code)
+    metrics.REGISTRY.inc('response_bytes_total', len(resp.content), endpoint='store_page')
+    if(resp.status_code >= 400):
+        metrics.REGISTRY.inc('request_errors_total', endpoint='store_page')
+
+    if(resp.status_code == 304):    # HTTP Not Modified
+        logging.info('Page for package "%s" unchanged since last fetch' % package_name)
+        metrics.REGISTRY.inc('cache_hits_total', cache='store_page')
+        return (validators.body(url), False)
 
     if(resp.status_code == 200):    # HTTP OK
         logging.info('Retrieved page for package "%s"' % package_name)
-        
-        tree = html.fromstring(resp.content)
-        return tree 
-    
+
+        # Capture mode: keep the raw HTML so it can be re-parsed later without the network
+        if(archive is not None):
+            archive.put(package_name, resp.content)
+
+        if(validators is not None):
+            validators.put(url, resp.content, etag=resp.headers.get('ETag'), lastModified=resp.headers.get('Last-Modified'))
+
+        return (resp.content, True)
+
+    # Anything else is an error, not just what raise_for_status() covers (4xx and 5xx)
     resp.raise_for_status()
+    raise requests.HTTPError('Unexpected HTTP %d for page of package "%s"' % (resp.status_code, package_name), response=resp)
+
+def load_app_page(package_name, archive, fetch_time=None):
+    # Replay mode: parse the newest archived page at or before fetch_time, no network access
+    (captured, digest) = archive.lookup(package_name, fetch_time)
+    logging.info('Loaded archived page for package "%s" captured at %d' % (package_name, captured))
+
+    return parse_app_page(archive.get(digest))
+
+def parse_app_page(content):
+    return html.fromstring(content)
 
 def get_app_name(html_tree):
     name_elts = html_tree.xpath('//*[@id="body-content"]/div/div/div[1]/div[1]/div/div[1]/div/div[2]/h1/div')
@@ -0,0 +1,149 @@
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import logging
+import multiprocessing
+
+try:
+    # As part of the apkfetch package
+    from . import publicmeta, pagearchive, apkfetch
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import publicmeta
+    import pagearchive
+    import apkfetch
+
+from googleplay_api import profiling
+
+# Re-runs the publicmeta extractors over saved store pages on a process pool.
+# A source is either a PageArchive root (has an index.tsv) or a plain directory
+# of <package>.html / <package>.html.gz files.
+
+def iter_tasks(source, latest_only=True):
+    # Yields (package, fetch_time, path) for every page to re-extract
+    if(os.path.exists(os.path.join(source, 'index.tsv'))):
+        archive = pagearchive.PageArchive(source)
+
+        if(latest_only):
+            latest = archive.latest()
+            for package in sorted(latest):
+                (fetch_time, digest) = latest[package]
+                yield (package, fetch_time, archive.object_path(digest))
+        else:
+            for (package, fetch_time, digest) in archive.entries():
+                yield (package, fetch_time, archive.object_path(digest))
+
+        return
+
+    assert os.path.isdir(source), 'Page source %s is not a directory or archive' % source
+    for filename in sorted(os.listdir(source)):
+        path = os.path.join(source, filename)
+        for suffix in ('.html.gz', '.html'):
+            if(filename.endswith(suffix)):
+                fetch_time = int(os.path.getmtime(path))
+                yield (filename[:-len(suffix)], fetch_time, path)
+                break
+
+def _read_page(path):
+    if(path.endswith('.gz')):
+        with gzip.open(path, 'rb') as f:
+            return f.read()
+
+    with io.open(path, 'rb') as f:
+        return f.read()
+
+def _extract(task):
+    # Runs in the worker processes; reading and decompressing happen here too
+    (package, fetch_time, path) = task
+    record = {'package': package, 'fetchTime': fetch_time}
+
+    try:
+        app_page = publicmeta.parse_app_page(_read_page(path))
+        record['public-meta'] = apkfetch.extract_public_metadata(app_page)
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+
+    return record
+
+def reextract(source, out=None, processes=None, chunksize=64, progress_every=1000, latest_only=True):
+    # Streams one JSON record per page to out (a file object) and returns (pages, failed, seconds)
+    processes = processes or multiprocessing.cpu_count()
+    assert processes > 0, 'processes was %d, must be greater than 0' % processes
+
+    # When the run is profiled, so are the workers, which do the actual work
+    pool = multiprocessing.Pool(processes, profiling.profileWorker, (profiling.currentPath(),))
+    pages = 0
+    failed = 0
+    start = time.time()
+
+    try:
+        for record in pool.imap_unordered(_extract, iter_tasks(source, latest_only), chunksize):
+            pages += 1
+            if('error' in record):
+                failed += 1
+
+            if(out is not None):
+                out.write(json.dumps(record, sort_keys=True))
+                out.write('\n')
+
+            if(progress_every and pages % progress_every == 0):
+                elapsed = time.time() - start
+                logging.info('Re-extracted %d pages (%d failed), %.1f pages/s' % (pages, failed, pages / max(elapsed, 1e-9)))
+    finally:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+    logging.info('Re-extracted %d pages (%d failed) in %.1fs with %d processes' % (pages, failed, elapsed, processes))
+
+    return (pages, failed, elapsed)
+
+def benchmark(source, process_counts=None, chunksize=64):
+    # Throughput at each pool size, reported as pages/s overall and per core
+    if(process_counts is None):
+        cpus = multiprocessing.cpu_count()
+        process_counts = sorted(set([1, max(1, cpus // 2), cpus]))
+
+    results = []
+    for processes in process_counts:
+        (pages, failed, elapsed) = reextract(source, processes=processes, chunksize=chunksize, progress_every=0)
+        rate = pages / max(elapsed, 1e-9)
+        results.append({ \
+            'processes': processes, \
+            'pages': pages, \
+            'failed': failed, \
+            'seconds': elapsed, \
+            'pagesPerSec': rate, \
+            'pagesPerSecPerCore': rate / processes
+        })
+
+    return results
+
+def _main(argv):
+    argv = profiling.startProfile(argv)
+    if(len(argv) < 2):
+        print('Usage: %s source [outfile|--benchmark] [processes] [--profile[=path]]' % argv[0])
+        print('Re-extract public metadata from saved store pages as JSON Lines.')
+        print('source: a page archive directory, or a directory of <package>.html[.gz] files')
+        sys.exit(0)
+
+    logging.basicConfig(level=logging.INFO)
+    source = argv[1]
+    target = argv[2] if len(argv) >= 3 else '-'
+    processes = int(argv[3]) if len(argv) >= 4 else None
+
+    if(target == '--benchmark'):
+        counts = [processes] if processes is not None else None
+        for result in benchmark(source, counts):
+            print(json.dumps(result, sort_keys=True))
+    elif(target == '-'):
+        reextract(source, sys.stdout, processes)
+    else:
+        with open(target, 'w') as out:
+            reextract(source, out, processes)
+
+if __name__ == '__main__':
+    _main(sys.argv)
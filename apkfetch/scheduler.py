@@ -0,0 +1,166 @@
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+try:
+    # As part of the apkfetch package
+    from . import catalog
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import catalog
+
+# Persistent priority queue of packages to (re)download, kept in SQLite so it survives restarts
+# and can be shared by several worker threads. Each package's score combines popularity
+# (install count), how recently it was updated and how long ago we last fetched it; workers
+# pop() the highest scores first, so the most important apps refresh first when bandwidth is short.
+
+DEFAULT_WEIGHTS = { \
+    'popularity': 1.0,  # per decade of installs
+    'recency': 3.0,     # for an update uploaded just now, decaying with recency_days
+    'staleness': 1.0,   # per staleness_days since our last fetch, capped at max_staleness
+}
+
+_DAY = 24 * 60 * 60
+
+def parse_num_downloads(num_downloads):
+    # AppDetails.numDownloads is display text such as "1,000,000+"; returns the lower bound or None
+    if(not num_downloads):
+        return None
+
+    digits = ''.join(c for c in num_downloads if c.isdigit())
+    return int(digits) if digits else None
+
+class Scheduler(object):
+    def __init__(self, path, weights=None, recency_days=30, staleness_days=7, max_staleness=4):
+        self.path = path
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or {})
+        self.recency_days = recency_days
+        self.staleness_days = staleness_days
+        self.max_staleness = max_staleness
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS queue (' \
+                         'package TEXT PRIMARY KEY, ' \
+                         'installs INTEGER, ' \
+                         'upload_ts INTEGER, ' \
+                         'version_code INTEGER, ' \
+                         'last_fetch_ts INTEGER, ' \
+                         'leased_until INTEGER NOT NULL DEFAULT 0, ' \
+                         'score REAL NOT NULL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS queue_score ON queue (score DESC)')
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM queue').fetchone()[0]
+
+    def score(self, installs, upload_ts, last_fetch_ts, now=None):
+        now = time.time() if now is None else now
+
+        popularity = math.log10(installs + 1) if installs else 0.0
+
+        recency = 0.0
+        if(upload_ts is not None):
+            age_days = max(0.0, (now - upload_ts) / float(_DAY))
+            recency = math.exp(-age_days / self.recency_days)
+
+        if(last_fetch_ts is None):
+            staleness = self.max_staleness
+        else:
+            staleness = min(self.max_staleness, max(0.0, (now - last_fetch_ts) / float(_DAY * self.staleness_days)))
+
+        return self.weights['popularity'] * popularity + \
+               self.weights['recency'] * recency + \
+               self.weights['staleness'] * staleness
+
+    def update(self, package, installs=None, upload_ts=None, version_code=None):
+        # Adds a package or refreshes what we know about it; unknown (None) fields keep their old value
+        self.update_many([(package, installs, upload_ts, version_code)])
+
+    def update_many(self, rows):
+        # rows of (package, installs, upload_ts, version_code), applied in one transaction
+        now = time.time()
+        with self._lock:
+            with self._db:
+                for (package, installs, upload_ts, version_code) in rows:
+                    existing = self._db.execute('SELECT installs, upload_ts, version_code, last_fetch_ts FROM queue WHERE package = ?', (package,)).fetchone()
+                    last_fetch_ts = None
+                    if(existing is not None):
+                        installs = existing[0] if installs is None else installs
+                        upload_ts = existing[1] if upload_ts is None else upload_ts
+                        version_code = existing[2] if version_code is None else version_code
+                        last_fetch_ts = existing[3]
+
+                    self._db.execute('INSERT OR REPLACE INTO queue (package, installs, upload_ts, version_code, last_fetch_ts, leased_until, score) ' \
+                                     'VALUES (?, ?, ?, ?, ?, COALESCE((SELECT leased_until FROM queue WHERE package = ?), 0), ?)', \
+                                     (package, installs, upload_ts, version_code, last_fetch_ts, package, self.score(installs, upload_ts, last_fetch_ts, now)))
+
+    def update_from_metadata(self, metadatas):
+        # From apkfetch.get_metadata() dicts; prefers the public install count over numDownloads
+        rows = []
+        for metadata in metadatas:
+            row = catalog.flatten_metadata(metadata)
+            installs = row['installs'] if row['installs'] is not None else parse_num_downloads(row['num_downloads'])
+            rows.append((row['package'], installs, row['upload_ts'], row['version_code']))
+
+        self.update_many(rows)
+
+    def update_from_docs(self, docs):
+        # From DocV2 protobufs, e.g. bulkDetails entries or searchIter()/listIter() results
+        rows = []
+        for doc in docs:
+            app_details = doc.details.appDetails
+            rows.append((doc.docid, parse_num_downloads(app_details.numDownloads), \
+                         catalog.parse_upload_date(app_details.uploadDate), app_details.versionCode or None))
+
+        self.update_many(rows)
+
+    def pop(self, count=1, lease_secs=3600):
+        # Leases the count highest-priority packages; they aren't handed out again until the
+        # lease expires or they are marked fetched/released
+        now = int(time.time())
+        with self._lock:
+            with self._db:
+                rows = self._db.execute('SELECT package FROM queue WHERE leased_until <= ? ORDER BY score DESC LIMIT ?', (now, count)).fetchall()
+                packages = [row[0] for row in rows]
+                self._db.executemany('UPDATE queue SET leased_until = ? WHERE package = ?', [(now + lease_secs, package) for package in packages])
+
+        return packages
+
+    def mark_fetched(self, package, fetch_ts=None):
+        fetch_ts = int(time.time()) if fetch_ts is None else fetch_ts
+        with self._lock:
+            with self._db:
+                row = self._db.execute('SELECT installs, upload_ts FROM queue WHERE package = ?', (package,)).fetchone()
+                if(row is None):
+                    return
+                score = self.score(row[0], row[1], fetch_ts, fetch_ts)
+                self._db.execute('UPDATE queue SET last_fetch_ts = ?, leased_until = 0, score = ? WHERE package = ?', (fetch_ts, score, package))
+
+    def release(self, package):
+        # Gives a leased package back without counting it as fetched (e.g. after a failure)
+        with self._lock:
+            with self._db:
+                self._db.execute('UPDATE queue SET leased_until = 0 WHERE package = ?', (package,))
+
+    def rescore(self, batch_size=10000):
+        # Scores drift as time passes (staleness grows, recency decays); run periodically
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute('SELECT package, installs, upload_ts, last_fetch_ts FROM queue').fetchall()
+            with self._db:
+                for start in range(0, len(rows), batch_size):
+                    self._db.executemany('UPDATE queue SET score = ? WHERE package = ?', \
+                                         [(self.score(installs, upload_ts, last_fetch_ts, now), package) \
+                                          for (package, installs, upload_ts, last_fetch_ts) in rows[start:start + batch_size]])
+
+        logging.info('Rescored %d queued packages' % len(rows))
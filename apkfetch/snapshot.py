@@ -0,0 +1,122 @@
+import io
+import sys
+import gzip
+import struct
+import logging
+
+try:
+    # As part of the apkfetch package
+    from . import catalog, apkfetch
+except (ImportError, ValueError):
+    # Run as a script from this directory
+    import catalog
+    import apkfetch
+
+# Compact binary catalog snapshots. A snapshot is the magic header followed by records
+#   <uint16 package length><package, utf-8><int64 versionCode><int64 upload timestamp, -1 if unknown>
+# sorted by package (utf-8 byte order), so two snapshots can be diffed with a streaming
+# merge-join in constant memory. Paths ending in .gz are gzip-compressed.
+
+MAGIC = b'APKSNAP1'
+_HEAD = struct.Struct('>H')
+_BODY = struct.Struct('>qq')
+
+def _open(path, mode):
+    if(path.endswith('.gz')):
+        return gzip.open(path, mode)
+
+    return io.open(path, mode)
+
+def records_from_bulk_details(api, packages, batch_size=100):
+    # (package, versionCode, uploadTimestamp) for every listed package, via bulkDetails
+    for (package, doc) in apkfetch.bulk_details(packages, batch_size, client=api):
+        if(doc is None):
+            continue
+
+        app_details = doc.details.appDetails
+        upload_ts = catalog.parse_upload_date(app_details.uploadDate)
+        yield (package, app_details.versionCode, upload_ts)
+
+def write_snapshot(path, records):
+    # Sorts and writes (package, versionCode, uploadTimestamp) records; returns the record count.
+    # Of several records for one package, the one with the highest versionCode is kept.
+    keyed = sorted(((package.encode('utf-8'), version_code, upload_ts) for (package, version_code, upload_ts) in records), \
+                   key=lambda record: (record[0], -(record[1] or 0)))
+
+    count = 0
+    previous = None
+    with _open(path, 'wb') as f:
+        f.write(MAGIC)
+        for (package, version_code, upload_ts) in keyed:
+            if(package == previous):
+                continue    # Keep the newest version of each package
+            previous = package
+
+            f.write(_HEAD.pack(len(package)))
+            f.write(package)
+            f.write(_BODY.pack(version_code or 0, -1 if upload_ts is None else upload_ts))
+            count += 1
+
+    logging.info('Wrote snapshot of %d packages to %s' % (count, path))
+    return count
+
+def read_snapshot(path):
+    # Streams (package, versionCode, uploadTimestamp) records in package order
+    with _open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC, '%s is not a package snapshot' % path
+
+        while True:
+            head = f.read(_HEAD.size)
+            if(len(head) == 0):
+                return
+            assert len(head) == _HEAD.size, 'Truncated snapshot %s' % path
+
+            (length,) = _HEAD.unpack(head)
+            package = f.read(length)
+            body = f.read(_BODY.size)
+            assert len(package) == length and len(body) == _BODY.size, 'Truncated snapshot %s' % path
+
+            (version_code, upload_ts) = _BODY.unpack(body)
+            yield (package.decode('utf-8'), version_code, None if upload_ts < 0 else upload_ts)
+
+def diff_snapshots(old_path, new_path):
+    # Merge-joins two snapshots, yielding (change, package, old versionCode, new versionCode)
+    # with change one of 'added', 'removed' or 'changed'
+    old_records = read_snapshot(old_path)
+    new_records = read_snapshot(new_path)
+    old = next(old_records, None)
+    new = next(new_records, None)
+
+    while old is not None or new is not None:
+        old_key = old[0].encode('utf-8') if old is not None else None
+        new_key = new[0].encode('utf-8') if new is not None else None
+
+        if(new is None or (old is not None and old_key < new_key)):
+            yield ('removed', old[0], old[1], None)
+            old = next(old_records, None)
+        elif(old is None or new_key < old_key):
+            yield ('added', new[0], None, new[1])
+            new = next(new_records, None)
+        else:
+            if(old[1] != new[1]):
+                yield ('changed', new[0], old[1], new[1])
+            old = next(old_records, None)
+            new = next(new_records, None)
+
+def download_queue(old_path, new_path):
+    # (package, versionCode) pairs to fetch: new packages and version changes
+    for (change, package, old_version, new_version) in diff_snapshots(old_path, new_path):
+        if(change != 'removed'):
+            yield (package, new_version)
+
+def _main(argv):
+    if(len(argv) < 3):
+        print('Usage: %s old_snapshot new_snapshot' % argv[0])
+        print('Print packages added, removed or changed between two snapshots.')
+        sys.exit(0)
+
+    for (change, package, old_version, new_version) in diff_snapshots(argv[1], argv[2]):
+        print('%s\t%s\t%s\t%s' % (change, package, '' if old_version is None else old_version, '' if new_version is None else new_version))
+
+if __name__ == '__main__':
+    _main(sys.argv)
@@ -0,0 +1,271 @@
+#!/usr/bin/python
+
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import resource
+import tempfile
+import platform
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+from googleplay_api import googleplay_pb2
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.mockserver import MockPlayServer, MockPlayServerProcess, configureApi
+from apkfetch import apkfetch, publicmeta
+
+USAGE = """Usage: %s [--pages DIR] [--out DIR] [--quick] [--compare OLD.json NEW.json]
+Benchmark the hot paths against the local mock Play server.
+--pages: directory of saved store pages (<package>.html) for the publicmeta extractors
+--out: where to store the JSON results (default: benchmarks/)
+--quick: fewer iterations and smaller APKs (too few for a p99)
+--compare: print the throughput ratio of two stored runs"""
+
+EXTRACTORS = ["has_iap", "get_dev_website", "get_dev_privacy", "get_dev_email", "get_dev_id",
+              "get_publish_timestamp_utc", "has_ads", "is_free", "get_categories", "get_icon_url",
+              "get_install_count", "is_family"]
+
+# Fewest samples a percentile is reported from; below that it is None
+MIN_SAMPLES = {50: 10, 99: 100}
+
+def peak_rss_mb():
+    """Peak RSS of this process. Every benchmark runs in a child process of
+    its own (see isolated()), so this is the peak of that benchmark alone."""
+    # VmHWM where available: ru_maxrss also counts what the parent process
+    # had mapped when this one was forked
+    try:
+        with io.open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+def percentile(samples, p):
+    if len(samples) < MIN_SAMPLES[p]:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+def _ms(seconds):
+    return seconds * 1000 if seconds is not None else None
+
+def _fmtMs(ms):
+    return "%8.3fms" % ms if ms is not None else "%10s" % "-"
+
+def measure(name, fn, iterations, units=1, unit="op"):
+    """Time iterations calls of fn; units is how much work one call does."""
+    latencies = []
+    start = time.time()
+    for _ in range(iterations):
+        t = time.time()
+        fn()
+        latencies.append(time.time() - t)
+    return report(name, latencies, time.time() - start, units, unit)
+
+def report(name, latencies, elapsed, units=1, unit="op"):
+    """Result of len(latencies) operations of units work each, taking elapsed
+    seconds of wall time between them (less than their sum when concurrent)."""
+    iterations = len(latencies)
+    result = {"name": name,
+              "iterations": iterations,
+              "throughput": iterations * units / elapsed if elapsed > 0 else None,
+              "unit": "%s/s" % unit,
+              "p50_ms": _ms(percentile(latencies, 50)),
+              "p99_ms": _ms(percentile(latencies, 99)),
+              "peak_rss_mb": peak_rss_mb()}
+    print("%-45s %12.1f %-8s p50 %s  p99 %s  rss %7.1fMB" % (name, result["throughput"] or 0, result["unit"],
+                                                             _fmtMs(result["p50_ms"]), _fmtMs(result["p99_ms"]), result["peak_rss_mb"]))
+    sys.stdout.flush()
+    return result
+
+def bench_parse(iterations):
+    results = []
+    server = MockPlayServer()
+    payloads = {
+        "details": server.respond("GET", "details", {"doc": ["com.bench.app"]}, b""),
+        "bulkDetails[500]": server.respond("POST", "bulkDetails", {}, _bulk_request(500)),
+        "list[100]": server.respond("GET", "list", {"cat": ["GAME"], "ctr": ["apps_topselling_free"], "n": ["100"]}, b""),
+    }
+    for name, wrapper in sorted(payloads.items()):
+        data = wrapper.SerializeToString()
+        results.append(measure("ResponseWrapper.FromString %s" % name,
+                               lambda: googleplay_pb2.ResponseWrapper.FromString(data), iterations,
+                               len(data) / 1e6, "MB"))
+
+    api = GooglePlayAPI()
+    details = payloads["details"].payload.detailsResponse
+    bulk = payloads["bulkDetails[500]"].payload.bulkDetailsResponse
+    results.append(measure("toDict DetailsResponse", lambda: api.toDict(details), iterations))
+    results.append(measure("toDict BulkDetailsResponse[500]", lambda: api.toDict(bulk), max(MIN_SAMPLES[50], iterations // 10), 500, "doc"))
+    return results
+
+def _bulk_request(n):
+    request = googleplay_pb2.BulkDetailsRequest()
+    request.docid.extend(["com.bench.app%d" % i for i in range(n)])
+    return request.SerializeToString()
+
+def bench_extractors(pages_dir, iterations):
+    results = []
+    pages = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.endswith(".html"):
+            with io.open(os.path.join(pages_dir, filename), "rb") as f:
+                pages.append(f.read())
+    if not pages:
+        logging.warning("No .html pages in %s, skipping extractor benchmarks" % pages_dir)
+        return results
+
+    results.append(measure("lxml parse store page", lambda: [publicmeta.parse_app_page(p) for p in pages],
+                           iterations, len(pages), "page"))
+    trees = [publicmeta.parse_app_page(p) for p in pages]
+    for name in EXTRACTORS:
+        extractor = getattr(publicmeta, name)
+        def run():
+            for tree in trees:
+                try:
+                    extractor(tree)
+                except AssertionError:
+                    pass # Layout differences between saved pages are not what we measure
+        results.append(measure("publicmeta.%s" % name, run, iterations, len(trees), "page"))
+    return results
+
+def bench_get_apk(url, size, concurrency, apks_per_run, runs=3):
+    """apks_per_run downloads at a time through concurrency threads, runs
+    times; the percentiles are of the single get_apk calls."""
+    api = configureApi(GooglePlayAPI(androidId="0"), url)
+    api.login(authSubToken="mock")
+    apkfetch.api = api
+    outdir = tempfile.mkdtemp(prefix="apkbench")
+    try:
+        latencies = []
+        def download(package):
+            t = time.time()
+            apkfetch.get_apk(package, outdir=outdir)
+            latencies.append(time.time() - t)
+
+        elapsed = 0
+        for run in range(runs):
+            # Fresh package names every run so nothing is skipped as already held
+            packages = ["com.bench.r%d.app%d" % (run, i) for i in range(apks_per_run)]
+            pool = ThreadPool(concurrency)
+            start = time.time()
+            try:
+                pool.map(download, packages)
+            finally:
+                pool.close()
+                pool.join()
+            elapsed += time.time() - start
+            for filename in os.listdir(outdir):
+                os.remove(os.path.join(outdir, filename))
+        return [report("get_apk %dKB x%d concurrency %d" % (size // 1024, apks_per_run, concurrency),
+                       latencies, elapsed, size / 1e6, "MB")]
+    finally:
+        shutil.rmtree(outdir)
+
+BENCHMARKS = {"parse": bench_parse, "extractors": bench_extractors, "get_apk": bench_get_apk}
+
+def isolated(benchmark, *args):
+    """Run BENCHMARKS[benchmark](*args) in a fresh interpreter, so that its
+    peak RSS is its own, and return its results."""
+    (fd, path) = tempfile.mkstemp(prefix="bench", suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.check_call([sys.executable, os.path.abspath(__file__), "--child", path, benchmark, json.dumps(args)])
+        with io.open(path, "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+    finally:
+        os.remove(path)
+
+def child(path, benchmark, args):
+    results = BENCHMARKS[benchmark](*json.loads(args))
+    with io.open(path, "wb") as f:
+        f.write(json.dumps(results).encode("utf-8"))
+
+def bench_downloads(sizes, concurrencies, apks_per_run, runs):
+    # The mock server runs in a process of its own, out of the client's RSS and CPU time
+    results = []
+    for size in sizes:
+        server = MockPlayServerProcess(apkSize=size).start()
+        try:
+            for concurrency in concurrencies:
+                results += isolated("get_apk", server.url, size, concurrency, apks_per_run, runs)
+        finally:
+            server.stop()
+    return results
+
+def git_commit():
+    try:
+        with io.open(os.devnull, "wb") as devnull:
+            return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=devnull,
+                                           cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except Exception:
+        return "unknown"
+
+def compare(old_path, new_path):
+    with io.open(old_path, "rb") as f:
+        old = dict((r["name"], r) for r in json.loads(f.read().decode("utf-8"))["results"])
+    with io.open(new_path, "rb") as f:
+        new = json.loads(f.read().decode("utf-8"))["results"]
+    for r in new:
+        if r["name"] in old and old[r["name"]]["throughput"] and r["throughput"]:
+            print("%-45s %6.2fx" % (r["name"], r["throughput"] / old[r["name"]]["throughput"]))
+
+def main(argv):
+    if "-h" in argv or "--help" in argv:
+        print(USAGE % argv[0])
+        sys.exit(0)
+    if "--child" in argv:
+        i = argv.index("--child")
+        child(*argv[i + 1:i + 4])
+        return
+    if "--compare" in argv:
+        i = argv.index("--compare")
+        compare(argv[i + 1], argv[i + 2])
+        return
+
+    pages_dir = argv[argv.index("--pages") + 1] if "--pages" in argv else None
+    out_dir = argv[argv.index("--out") + 1] if "--out" in argv else "benchmarks"
+    quick = "--quick" in argv
+
+    iterations = 20 if quick else 200
+    sizes = [256 * 1024, 4 << 20] if quick else [1 << 20, 16 << 20, 64 << 20]
+    concurrencies = [1, 4] if quick else [1, 4, 16]
+
+    results = isolated("parse", iterations)
+    if pages_dir is not None:
+        results += isolated("extractors", pages_dir, max(MIN_SAMPLES[50], iterations // 10))
+    # Enough downloads for a p99 unless quick
+    apks_per_run = 4 if quick else 16
+    runs = 3 if quick else -(-MIN_SAMPLES[99] // apks_per_run)
+    results += bench_downloads(sizes, concurrencies, apks_per_run, runs)
+
+    commit = git_commit()
+    report = {"commit": commit,
+              "timestamp": int(time.time()),
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "results": results}
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    path = os.path.join(out_dir, "%s-%d.json" % (commit, report["timestamp"]))
+    with io.open(path, "wb") as f:
+        f.write(json.dumps(report, indent=2, sort_keys=True).encode("utf-8"))
+    print("Results saved to %s" % path)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -16,8 +16,11 @@ except ImportError:
     # Python 3
     import urllib.parse as urlparse
 
+import helpers
 from googleplay_api.googleplay import GooglePlayAPI
 
+sys.argv = helpers.pop_output_format(sys.argv)
+
 # read config from config.py
 config = GooglePlayAPI.read_config()
 
@@ -26,9 +29,10 @@ api = GooglePlayAPI(config['ANDROID_ID'])
 api.login(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['AUTH_TOKEN'])
 response = api.browse()
 
-print("ID", "Name", sep=config['SEPARATOR'])
+writer = helpers.get_writer()
+writer.writeHeader(["ID", "Name"])
 for c in response.category:
     category = urlparse.parse_qs(c.dataUrl)['cat'][0]
     name = c.name
-    print(category, name, sep=config['SEPARATOR'])
+    writer.write(["category", "name"], [category, name])
 
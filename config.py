@@ -7,6 +7,8 @@ ANDROID_ID      = None # "38c6523ac43ef9e1"
 GOOGLE_LOGIN    = None # 'someone@gmail.com'
 GOOGLE_PASSWORD = None # 'yourpassword'
 AUTH_TOKEN      = None # "yyyyyyyyy"
+SEPARATOR       = ";"
+OUTPUT_FORMAT   = "csv" # csv or jsonl, scripts also accept --format=...
 
 # force the user to edit this file
 if ANDROID_ID == NONE
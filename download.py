@@ -12,9 +12,12 @@ import io
 
 import helpers
 from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api import profiling
+
+sys.argv = profiling.startProfile(sys.argv)
 
 if (len(sys.argv) < 2):
-    print("Usage: %s packagename [filename]")
+    print("Usage: %s packagename [filename] [--profile[=path]]")
     print("Download an app.")
     print("If filename is not present, will write to '<packagename>_<versioncode>.apk'.")
     sys.exit(0)
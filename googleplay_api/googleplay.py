@@ -9,10 +9,17 @@ from __future__ import unicode_literals
 
 import os
 import io
+import time
 import logging
 import base64
-import gzip
+import zlib
+import hashlib
+import threading
 import requests
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from google.protobuf import descriptor
 from google.protobuf.internal.containers import RepeatedCompositeFieldContainer
@@ -20,6 +27,8 @@ from google.protobuf import text_format
 from google.protobuf.message import Message, DecodeError
 
 from googleplay_api import googleplay_pb2
+from googleplay_api import metrics
+from googleplay_api import tracing
 
 class LoginError(Exception):
     def __init__(self, value):
@@ -28,19 +37,88 @@ class LoginError(Exception):
         return repr(self.value)
 
 class RequestError(Exception):
-    def __init__(self, value):
+    """status is the HTTP status code when the server answered with an
+    error, None for failures on this side (verification, decoding)."""
+    def __init__(self, value, status=None):
         self.value = value
+        self.status = status
     def __str__(self):
         return repr(self.value)
 
 config = None
 
+# Accept-Encoding sent to every endpoint unless configured otherwise, see GooglePlayAPI
+DEFAULT_ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+
+class _DeflateDecoder(object):
+    """Content-Encoding: deflate is meant to be zlib-wrapped, but some
+    servers send a raw deflate stream; tell them apart on the first chunk."""
+    def __init__(self):
+        self.decompressor = None
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            self.decompressor = zlib.decompressobj()
+            try:
+                return self.decompressor.decompress(data)
+            except zlib.error:
+                self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.decompressor.decompress(data)
+
+    def flush(self):
+        return self.decompressor.flush() if self.decompressor is not None else b""
+
+class _BrotliDecoder(object):
+    def __init__(self):
+        decompressor = brotli.Decompressor()
+        # brotli names it process(), brotlicffi/brotlipy decompress()
+        self.decompress = getattr(decompressor, "process", None) or decompressor.decompress
+
+    def flush(self):
+        return b""
+
+def _decoder(contentEncoding):
+    """Incremental decoder (decompress()/flush()) for a Content-Encoding."""
+    if contentEncoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if contentEncoding == "deflate":
+        return _DeflateDecoder()
+    if contentEncoding == "br" and brotli is not None:
+        return _BrotliDecoder()
+    raise RequestError("Unsupported Content-Encoding %s" % contentEncoding)
+
+class _PageFetch(threading.Thread):
+    """Fetches one page in the background so that its latency overlaps with
+    the caller's processing of the previous page."""
+    def __init__(self, fetch, path):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fetch = fetch
+        self.path = path
+        self.response = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.response = self.fetch(self.path)
+        except Exception as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.response
+
 class GooglePlayAPI(object):
     """Google Play Unofficial API Class
 
     Usual APIs methods are login(), search(), details(), bulkDetails(),
     download(), browse(), reviews() and list().
 
+    searchIter() and listIter() page through every result of search() and
+    list() respectively.
+
     toStr() can be used to pretty print the result (protobuf object) of the
     previous methods.
 
@@ -48,6 +126,7 @@ class GooglePlayAPI(object):
 
     SERVICE = "androidmarket"
     URL_LOGIN = "https://android.clients.google.com/auth" # "https://www.google.com/accounts/ClientLogin"
+    URL_FDFE = "https://android.clients.google.com/fdfe"
     ACCOUNT_TYPE_GOOGLE = "GOOGLE"
     ACCOUNT_TYPE_HOSTED = "HOSTED"
     ACCOUNT_TYPE_HOSTED_OR_GOOGLE = "HOSTED_OR_GOOGLE"
@@ -60,8 +139,23 @@ class GooglePlayAPI(object):
     USER_AGENT = 'Android-Finsky/4.4.3 (api=3,versionCode=8013013,sdk=19,device=hammerhead,hardware=hammerhead,product=hammerhead)'
     DL_USER_AGENT = 'AndroidDownloadManager/4.4.3 (Linux; U; Android 4.4.3; Nexus S Build/JRO03E)'
 
-    def __init__(self, androidId=None, lang=None, debug=False): # you must use a device-associated androidId value
+    def __init__(self, androidId=None, lang=None, debug=False, validators=None, tracer=None, acceptEncoding=None): # you must use a device-associated androidId value
         self.preFetch = {}
+        # Accept-Encoding per endpoint ("auth", "details", "bulkDetails",
+        # ...), "*" for the others; "" asks for an uncompressed response
+        self.acceptEncoding = {"*": DEFAULT_ACCEPT_ENCODING}
+        self.acceptEncoding.update(acceptEncoding or {})
+        # Optional ValidatorCache: GET requests are revalidated with
+        # If-None-Match/If-Modified-Since and a 304 reuses the stored body
+        self.validators = validators
+        # Optional tracing.Tracer: every request becomes a span with its
+        # dns/connect/tls/ttfb/body/decode phase timings
+        self.tracer = tracer or tracing.NULL_TRACER
+        self.session = requests.Session()
+        if self.tracer.enabled:
+            adapter = tracing.TracingAdapter()
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
         #if androidId == None:
         #    androidId = config.ANDROID_ID
         #if lang == None:
@@ -134,6 +228,8 @@ class GooglePlayAPI(object):
         if ("preFetch" in fields):
             for p in protoObj.preFetch:
                 self.preFetch[p.url] = p.response
+                if self.validators is not None and p.etag:
+                    self.validators.put(p.url, p.response, etag=p.etag)
 
     def setAuthSubToken(self, authSubToken):
         self.authSubToken = authSubToken
@@ -167,10 +263,12 @@ class GooglePlayAPI(object):
                                 "lang": "us",
                                 "sdk_version": "22"}
             headers = {
-                "Accept-Encoding": "",
+                "Accept-Encoding": self.encodingFor("auth"),
             }
             self.proxy_dict = proxy
-            response = requests.post(self.URL_LOGIN, data=params, headers=headers, proxies=proxy, verify=True)
+            with self.tracer.span("auth"), metrics.REGISTRY.timer("request_latency_seconds", endpoint="auth"):
+                response = self.session.post(self.URL_LOGIN, data=params, headers=headers, proxies=proxy, verify=True)
+            metrics.REGISTRY.inc("requests_total", endpoint="auth", status=response.status_code)
             data = response.text.split()
             params = {}
             for d in data:
@@ -181,63 +279,167 @@ class GooglePlayAPI(object):
                 #print("Auth-Token found: %s" % params["auth"])
                 self.setAuthSubToken(params["auth"])
             elif "error" in params:
+                metrics.REGISTRY.inc("request_errors_total", endpoint="auth")
                 raise LoginError("server says: " + params["error"])
             else:
+                metrics.REGISTRY.inc("request_errors_total", endpoint="auth")
                 raise LoginError("Auth token not found.")
 
     def executeRequestApi2(self, path, datapost=None, post_content_type="application/x-www-form-urlencoded; charset=UTF-8"):
-        if (datapost is None and path in self.preFetch):
-            data = self.preFetch[path]
-        else:
-            headers = { "Accept-Language": self.lang,
-                                    "Authorization": "GoogleLogin auth=%s" % self.authSubToken,
-                                    "X-DFE-Enabled-Experiments": "cl:billing.select_add_instrument_by_default",
-                                    "X-DFE-Unsupported-Experiments": "nocache:billing.use_charging_poller,market_emails,buyer_currency,prod_baseline,checkin.set_asset_paid_app_field,shekel_test,content_ratings,buyer_currency_in_app,nocache:encrypted_apk,recent_changes",
-                                    "X-DFE-Device-Id": self.androidId,
-                                    "X-DFE-Client-Id": "am-android-google",
-                                    "User-Agent": self.USER_AGENT,
-                                    "X-DFE-SmallestScreenWidthDp": "335",
-                                    "X-DFE-Filter-Level": "3",
-                                    "Accept-Encoding": "",
-                                    "Host": "android.clients.google.com"}
-
-            if datapost is not None:
-                headers["Content-Type"] = post_content_type
-
-            url = "https://android.clients.google.com/fdfe/%s" % path
-            if datapost is not None:
-                response = requests.post(url, data=datapost, headers=headers, proxies=self.proxy_dict, verify=True)
+        endpoint = path.split("?", 1)[0]
+        with self.tracer.span("fdfe", endpoint=endpoint, method="GET" if datapost is None else "POST") as span:
+            if (datapost is None and path in self.preFetch):
+                metrics.REGISTRY.inc("cache_hits_total", cache="prefetch")
+                data = self.preFetch[path]
             else:
-                response = requests.get(url, headers=headers, proxies=self.proxy_dict, verify=True)
-            data = response.content
-            #print(data)
-        '''
-        data = StringIO.StringIO(data)
-        gzipper = gzip.GzipFile(fileobj=data)
-        data = gzipper.read()
-        '''
-        message = googleplay_pb2.ResponseWrapper.FromString(data)
-        self._try_register_preFetch(message)
+                if datapost is None:
+                    metrics.REGISTRY.inc("cache_misses_total", cache="prefetch")
+                data = self._fetchFdfe(path, endpoint, span, datapost, post_content_type)
+            with self.tracer.phase("decode"):
+                message = googleplay_pb2.ResponseWrapper.FromString(data)
+            with self.tracer.phase("prefetch_register"):
+                self._try_register_preFetch(message)
 
         # Debug
         #print text_format.MessageToString(message)
         return message
 
+    def encodingFor(self, endpoint):
+        """Accept-Encoding header value for requests to endpoint."""
+        return self.acceptEncoding.get(endpoint, self.acceptEncoding.get("*", ""))
+
+    @staticmethod
+    def _readBody(response, chunkSize=65536):
+        """Read a streamed response, decompressing it chunk by chunk as it
+        arrives. Returns the decoded body and the bytes received."""
+        contentEncoding = response.headers.get("Content-Encoding", "").strip().lower()
+        chunks = response.raw.stream(chunkSize, decode_content=False)
+        if contentEncoding in ("", "identity"):
+            content = b"".join(chunks)
+            return (content, len(content))
+
+        decoder = _decoder(contentEncoding)
+        parts = []
+        received = 0
+        try:
+            for chunk in chunks:
+                received += len(chunk)
+                parts.append(decoder.decompress(chunk))
+            parts.append(decoder.flush())
+        except zlib.error as e:
+            raise RequestError("Corrupt %s response body: %s" % (contentEncoding, e))
+        return (b"".join(parts), received)
+
+    def _fetchFdfe(self, path, endpoint, span, datapost, post_content_type):
+        headers = { "Accept-Language": self.lang,
+                                "Authorization": "GoogleLogin auth=%s" % self.authSubToken,
+                                "X-DFE-Enabled-Experiments": "cl:billing.select_add_instrument_by_default",
+                                "X-DFE-Unsupported-Experiments": "nocache:billing.use_charging_poller,market_emails,buyer_currency,prod_baseline,checkin.set_asset_paid_app_field,shekel_test,content_ratings,buyer_currency_in_app,nocache:encrypted_apk,recent_changes",
+                                "X-DFE-Device-Id": self.androidId,
+                                "X-DFE-Client-Id": "am-android-google",
+                                "User-Agent": self.USER_AGENT,
+                                "X-DFE-SmallestScreenWidthDp": "335",
+                                "X-DFE-Filter-Level": "3",
+                                "Accept-Encoding": self.encodingFor(endpoint)}
+
+        if datapost is not None:
+            headers["Content-Type"] = post_content_type
+        elif self.validators is not None:
+            headers.update(self.validators.conditionalHeaders(path))
+
+        url = "%s/%s" % (self.URL_FDFE, path)
+        try:
+            with metrics.REGISTRY.timer("request_latency_seconds", endpoint=endpoint):
+                sent = time.time()
+                if datapost is not None:
+                    response = self.session.post(url, data=datapost, headers=headers, proxies=self.proxy_dict, verify=True, stream=True)
+                else:
+                    response = self.session.get(url, headers=headers, proxies=self.proxy_dict, verify=True, stream=True)
+                tracing.recordTtfb(span, sent)
+                with self.tracer.phase("body"):
+                    (content, received) = self._readBody(response)
+        except requests.RequestException:
+            metrics.REGISTRY.inc("request_errors_total", endpoint=endpoint)
+            raise
+        metrics.REGISTRY.inc("requests_total", endpoint=endpoint, status=response.status_code)
+        metrics.REGISTRY.inc("response_bytes_total", received, endpoint=endpoint)
+        metrics.REGISTRY.inc("response_decoded_bytes_total", len(content), endpoint=endpoint)
+        if span is not None:
+            span.attributes.update(status=response.status_code, bytes=received, decodedBytes=len(content))
+        if response.status_code >= 400:
+            metrics.REGISTRY.inc("request_errors_total", endpoint=endpoint)
+            raise RequestError("%s: HTTP %d %s" % (endpoint, response.status_code, response.reason),
+                               status=response.status_code)
+
+        if response.status_code == 304: # Not Modified, reuse the stored body
+            logging.debug("%s unchanged since last fetch" % path)
+            metrics.REGISTRY.inc("cache_hits_total", cache="validators")
+            return self.validators.body(path)
+
+        if datapost is None and self.validators is not None and response.status_code == 200:
+            self.validators.put(path, content,
+                                etag=response.headers.get("ETag"),
+                                lastModified=response.headers.get("Last-Modified"))
+        #print(content)
+        return content
+
     #####################################
     # Google Play API Methods
     #####################################
 
-    def search(self, query, nb_results=None, offset=None):
-        """Search for apps."""
+    def _searchPath(self, query, nb_results=None, offset=None):
         path = "search?c=3&q=%s" % requests.utils.quote(query) # TODO handle categories
         if (nb_results is not None):
             path += "&n=%d" % int(nb_results)
         if (offset is not None):
             path += "&o=%d" % int(offset)
+        return path
 
-        message = self.executeRequestApi2(path)
+    def search(self, query, nb_results=None, offset=None):
+        """Search for apps."""
+        message = self.executeRequestApi2(self._searchPath(query, nb_results, offset))
         return message.payload.searchResponse
 
+    def searchIter(self, query, nb_results=None, offset=None, prefetch=True):
+        """Iterate over all search results (DocV2 apps), fetching further pages
+        as needed until the result set is exhausted.
+
+        nb_results is the page size. With prefetch, the next page is
+        requested while the caller processes the current one."""
+        return self._iterPages(lambda o: self._searchPath(query, nb_results, o),
+                               "searchResponse", nb_results, offset, prefetch)
+
+    def _iterPages(self, pathAt, payloadField, nb_results=None, offset=None, prefetch=True):
+        """Follow a paginated container: nextPageUrl from its ContainerMetadata
+        when the server provides one, otherwise step the offset as long as
+        pages come back full."""
+        fetch = lambda path: getattr(self.executeRequestApi2(path).payload, payloadField)
+        response = fetch(pathAt(offset))
+        offset = int(offset or 0)
+
+        while True:
+            if len(response.doc) == 0:
+                return
+            container = response.doc[0]
+            offset += len(container.child)
+
+            nextPath = container.containerMetadata.nextPageUrl or None
+            if (nextPath is None and nb_results is not None
+                    and len(container.child) >= int(nb_results)):
+                nextPath = pathAt(offset)
+
+            pending = None
+            if nextPath is not None and prefetch:
+                pending = _PageFetch(fetch, nextPath)
+                pending.start()
+
+            for doc in container.child:
+                yield doc
+
+            if nextPath is None or len(container.child) == 0:
+                return
+            response = pending.result() if pending is not None else fetch(nextPath)
+
     def details(self, packageName):
         """Get app details from a package name.
         packageName is the app unique ID (usually starting with 'com.')."""
@@ -270,22 +472,31 @@ class GooglePlayAPI(object):
         message = self.executeRequestApi2(path)
         return message.payload.browseResponse
 
+    def _listPath(self, cat, ctr=None, nb_results=None, offset=None):
+        path = "list?c=3&cat=%s" % requests.utils.quote(cat)
+        if (ctr != None):
+            path += "&ctr=%s" % requests.utils.quote(ctr)
+        if (nb_results != None):
+            path += "&n=%s" % requests.utils.quote(str(nb_results))
+        if (offset != None):
+            path += "&o=%s" % requests.utils.quote(str(offset))
+        return path
+
     def list(self, cat, ctr=None, nb_results=None, offset=None):
         """List apps.
 
         If ctr (subcategory ID) is None, returns a list of valid subcategories.
 
         If ctr is provided, list apps within this subcategory."""
-        path = "list?c=3&cat=%s" % requests.utils.quote(cat)
-        if (ctr != None):
-            path += "&ctr=%s" % requests.utils.quote(ctr)
-        if (nb_results != None):
-            path += "&n=%s" % requests.utils.quote(nb_results)
-        if (offset != None):
-            path += "&o=%s" % requests.utils.quote(offset)
-        message = self.executeRequestApi2(path)
+        message = self.executeRequestApi2(self._listPath(cat, ctr, nb_results, offset))
         return message.payload.listResponse
 
+    def listIter(self, cat, ctr, nb_results=None, offset=None, prefetch=True):
+        """Iterate over all apps (DocV2) within a subcategory, fetching further
+        pages as needed. See searchIter()."""
+        return self._iterPages(lambda o: self._listPath(cat, ctr, nb_results, o),
+                               "listResponse", nb_results, offset, prefetch)
+
     def reviews(self, packageName, filterByDevice=False, sort=2, nb_results=None, offset=None):
         """Browse reviews.
         packageName is the app unique ID.
@@ -300,31 +511,140 @@ class GooglePlayAPI(object):
         message = self.executeRequestApi2(path)
         return message.payload.reviewResponse
 
-    def download(self, packageName, versionCode, offerType=1):
-        """Download an app and return its raw data (APK file).
-
-        packageName is the app unique ID (usually starting with 'com.').
+    def purchase(self, packageName, versionCode, offerType=1, baseVersionCode=None, patchFormats=()):
+        """Acquire an app and return its AndroidAppDeliveryData, which holds
+        the download URL, cookies and expected size of the APK.
 
-        versionCode can be grabbed by using the details() method on the given
-        app."""
+        With the baseVersionCode of an APK already held and the patchFormats
+        the caller can apply, the server may add patchData for a delta
+        update from that version."""
         path = "purchase"
         data = "ot=%d&doc=%s&vc=%d" % (offerType, packageName, versionCode)
+        if baseVersionCode is not None:
+            data += "&bvc=%d" % baseVersionCode
+            data += "".join("&pf=%d" % patchFormat for patchFormat in patchFormats)
         message = self.executeRequestApi2(path, data)
+        return message.payload.buyResponse.purchaseStatusResponse.appDeliveryData
 
-        url = message.payload.buyResponse.purchaseStatusResponse.appDeliveryData.downloadUrl
-        #print(message)
-        #print(message.payload)
-        cookie = message.payload.buyResponse.purchaseStatusResponse.appDeliveryData.downloadAuthCookie[0]
-
-        cookies = {
-            str(cookie.name): str(cookie.value) # python-requests #459 fixes this
-        }
+    def streamUrl(self, url, cookies=None, chunkSize=65536, offset=0):
+        """Fetch url from the download servers, yielding the body in chunks
+        of at most chunkSize bytes as they arrive.
 
+        A non-zero offset resumes a partial download from that byte, with a
+        Range request; if the server ignores it, the bytes before offset are
+        skipped over instead."""
         headers = {
                    "User-Agent" : self.DL_USER_AGENT,
                    "Accept-Encoding": "",
                   }
+        if offset > 0:
+            headers["Range"] = "bytes=%d-" % offset
+
+        start = time.time()
+        received = 0
+        # The span stays open while the caller consumes the chunks, but is
+        # only current on this thread while the request itself is sent
+        span = self.tracer.start("download", url=url.split("?", 1)[0])
+        try:
+            with self.tracer.activate(span):
+                response = self.session.get(url, headers=headers, cookies=cookies, proxies=self.proxy_dict, verify=True, stream=True)
+                tracing.recordTtfb(span, start)
+        except Exception:
+            self.tracer.finish(span)
+            raise
+        metrics.REGISTRY.inc("requests_total", endpoint="download", status=response.status_code)
+        bodyStart = time.time()
+        try:
+            response.raise_for_status()
+            skip = offset if response.status_code != 206 else 0
+            for chunk in response.iter_content(chunkSize):
+                received += len(chunk)
+                if skip > 0:
+                    (skipped, chunk) = (chunk[:skip], chunk[skip:])
+                    skip -= len(skipped)
+                    if not chunk:
+                        continue
+                yield chunk
+        except Exception as e:
+            metrics.REGISTRY.inc("request_errors_total", endpoint="download")
+            if span is not None:
+                span.error = "%s: %s" % (type(e).__name__, e)
+            raise
+        finally:
+            response.close()
+            metrics.REGISTRY.inc("response_bytes_total", received, endpoint="download")
+            metrics.REGISTRY.observe("request_latency_seconds", time.time() - start, endpoint="download")
+            if span is not None:
+                span.record("body", time.time() - bodyStart, bodyStart)
+                span.attributes.update(status=response.status_code, bytes=received)
+            self.tracer.finish(span)
+
+    def downloadStream(self, packageName, versionCode, offerType=1, chunkSize=65536, verify=True):
+        """Download an app, yielding the raw APK data in chunks instead of
+        holding the whole file in memory. See download().
+
+        With verify, the data is checked against the size and SHA-1
+        signature of the delivery data while it streams, and RequestError is
+        raised after the last chunk if either does not match, so that
+        callers writing to a temp file know not to keep it."""
+        deliveryData = self.purchase(packageName, versionCode, offerType)
+        return self.deliveryStream(deliveryData, chunkSize, verify, packageName)
+
+    def deliveryCookies(self, deliveryData):
+        cookie = deliveryData.downloadAuthCookie[0]
+
+        return {
+            str(cookie.name): str(cookie.value) # python-requests #459 fixes this
+        }
+
+    def deliveryStream(self, deliveryData, chunkSize=65536, verify=True, name="download"):
+        """Stream the full APK of an AndroidAppDeliveryData returned by
+        purchase(), verified as in downloadStream()."""
+        chunks = self.streamUrl(deliveryData.downloadUrl, self.deliveryCookies(deliveryData), chunkSize)
+        if verify:
+            chunks = self.verifyDelivery(chunks, deliveryData, name)
+        return chunks
+
+    def verifyDelivery(self, chunks, deliveryData, name="download"):
+        """verifyStream() against the size and signature of the full APK in
+        deliveryData, e.g. for one rebuilt from a patch."""
+        size = deliveryData.downloadSize if deliveryData.HasField("downloadSize") else None
+        return self.verifyStream(chunks, size, deliveryData.signature or None, name)
 
-        response = requests.get(url, headers=headers, cookies=cookies, proxies=self.proxy_dict, verify=True)
-        return response.content
+    @staticmethod
+    def verifyStream(chunks, size=None, signature=None, name="download"):
+        """Pass chunks through, raising RequestError at the end if their
+        total length is not size or the base64 SHA-1 of the data is not
+        signature (either check is skipped when None)."""
+        sha1 = hashlib.sha1()
+        received = 0
+        for chunk in chunks:
+            received += len(chunk)
+            if size is not None and received > size:
+                metrics.REGISTRY.inc("verification_failures_total", reason="size")
+                raise RequestError("%s: received more than the expected %d bytes" % (name, size))
+            sha1.update(chunk)
+            yield chunk
+
+        if size is not None and received != size:
+            metrics.REGISTRY.inc("verification_failures_total", reason="size")
+            raise RequestError("%s: received %d bytes, expected %d" % (name, received, size))
+        if signature is not None:
+            # The signature comes url-safe and unpadded; accept the standard alphabet too
+            normalize = lambda b64: b64.replace("+", "-").replace("/", "_").rstrip("=")
+            digest = base64.urlsafe_b64encode(sha1.digest()).decode("ascii")
+            if normalize(digest) != normalize(signature):
+                metrics.REGISTRY.inc("verification_failures_total", reason="signature")
+                raise RequestError("%s: SHA-1 %s does not match signature %s" % (name, digest, signature))
+
+    def download(self, packageName, versionCode, offerType=1):
+        """Download an app and return its raw data (APK file).
+
+        packageName is the app unique ID (usually starting with 'com.').
+
+        versionCode can be grabbed by using the details() method on the given
+        app.
 
+        Raises RequestError if the data fails verification (see
+        downloadStream())."""
+        return b"".join(self.downloadStream(packageName, versionCode, offerType))
@@ -0,0 +1,179 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import time
+import atexit
+import threading
+
+# Latency buckets (seconds), from a fast cached response to a slow APK download
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+class Histogram(object):
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def toDict(self):
+        return {"buckets": list(self.buckets), "counts": list(self.counts),
+                "sum": self.sum, "count": self.count}
+
+class Registry(object):
+    """In-process metrics: labelled counters and latency histograms.
+
+    Counters used by the library:
+    - requests_total{endpoint,status}, request_errors_total{endpoint}
+    - response_bytes_total{endpoint} (as received, i.e. compressed)
+    - response_decoded_bytes_total{endpoint}
+    - auth_retries_total
+    - cache_hits_total{cache}, cache_misses_total{cache}
+    - verification_failures_total{reason}
+    - delta_downloads_total{result}
+    Histograms: request_latency_seconds{endpoint}"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, "%s" % v) for (k, v) in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed time of its block."""
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self):
+        """A JSON serializable copy of every metric."""
+        with self._lock:
+            return {
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for ((name, labels), value) in sorted(self.counters.items())],
+                "histograms": [dict(h.toDict(), name=name, labels=dict(labels))
+                               for ((name, labels), h) in sorted(self.histograms.items())],
+            }
+
+class _Timer(object):
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.registry.observe(self.name, time.time() - self.start, **self.labels)
+
+REGISTRY = Registry()
+
+# HELP text for the metrics the library records
+DESCRIPTIONS = {
+    "requests_total": "Requests completed, by endpoint and HTTP status.",
+    "request_errors_total": "Requests that failed or got an HTTP error status.",
+    "response_bytes_total": "Response bytes received, before decompression.",
+    "response_decoded_bytes_total": "Response bytes after decompression.",
+    "auth_retries_total": "Failed login attempts that were retried.",
+    "cache_hits_total": "Responses served from a cache.",
+    "cache_misses_total": "Lookups that missed a cache.",
+    "verification_failures_total": "Downloads rejected by size or signature verification.",
+    "delta_downloads_total": "Delta (patch) download attempts, by result.",
+    "request_latency_seconds": "Request latency in seconds.",
+}
+
+def _labelText(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                             for (k, v) in labels)
+
+class PrometheusTextExporter(object):
+    """Renders a registry in the Prometheus text exposition format, e.g. for
+    the node_exporter textfile collector."""
+
+    def __init__(self, path=None):
+        self.path = path
+
+    @staticmethod
+    def _family(lines, name, metricType):
+        if name in DESCRIPTIONS:
+            lines.append("# HELP %s %s" % (name, DESCRIPTIONS[name]))
+        lines.append("# TYPE %s %s" % (name, metricType))
+
+    def render(self, registry):
+        lines = []
+        with registry._lock:
+            family = None
+            for (name, labels), value in sorted(registry.counters.items()):
+                if name != family:
+                    self._family(lines, name, "counter")
+                    family = name
+                lines.append("%s%s %s" % (name, _labelText(labels), value))
+            for (name, labels), h in sorted(registry.histograms.items()):
+                if name != family:
+                    self._family(lines, name, "histogram")
+                    family = name
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (name, _labelText(labels + (("le", bound),)), cumulative))
+                lines.append("%s_sum%s %f" % (name, _labelText(labels), h.sum))
+                lines.append("%s_count%s %d" % (name, _labelText(labels), h.count))
+        return "\n".join(lines) + "\n"
+
+    def export(self, registry=REGISTRY):
+        text = self.render(registry)
+        if self.path is not None:
+            with io.open(self.path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+
+class JsonExporter(object):
+    """Dumps a registry snapshot as JSON."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, registry=REGISTRY):
+        snapshot = registry.snapshot()
+        with io.open(self.path, "wb") as f:
+            f.write(json.dumps(snapshot, indent=2, sort_keys=True).encode("utf-8"))
+        return snapshot
+
+def exportOnExit(exporter, registry=REGISTRY):
+    """Run exporter.export(registry) when the interpreter exits."""
+    atexit.register(exporter.export, registry)
@@ -0,0 +1,436 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import sys
+import zlib
+import time
+import base64
+import random
+import struct
+import hashlib
+import logging
+import threading
+import subprocess
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    import urlparse
+    from urllib import quote
+except ImportError:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    import urllib.parse as urlparse
+    from urllib.parse import quote
+
+from googleplay_api import googleplay_pb2
+
+CATEGORIES = ["GAME", "TOOLS", "WEATHER", "COMMUNICATION", "EDUCATION"]
+SUBCATEGORIES = ["apps_topselling_free", "apps_topselling_paid", "apps_topgrossing"]
+
+class MockPlayServer(object):
+    """A local stand-in for the Google Play endpoints used by GooglePlayAPI:
+    auth, fdfe/details, bulkDetails, search, list, browse, rev, purchase and a
+    CDN serving the APKs, so that benchmarks and concurrency features can be
+    measured reproducibly without Google credentials.
+
+    Responses are synthesized deterministically from the package name, or
+    served from recordedDir when it holds a recording for the request (see
+    recordingPath()). latency (seconds) is added to every request,
+    failureRate is the probability of an HTTP 500, every throttleEvery-th
+    request gets an HTTP 429, and bandwidth (bytes/s) limits APK downloads.
+    Every app has additionalFiles expansion files (OBBs) of apkSize bytes.
+    With patches, a purchase naming a base version (bvc) and GDIFF among its
+    patch formats (pf) gets patchData for a delta update, see patch().
+
+    Usage:
+        server = MockPlayServer(apkSize=4 << 20)
+        server.start()
+        api = GooglePlayAPI(androidId="0")
+        server.configure(api)
+        api.login(authSubToken="mock")
+        ...
+        server.stop()"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, failureRate=0.0, throttleEvery=0,
+                 bandwidth=None, apkSize=1 << 20, resultsPerQuery=250, recordedDir=None, seed=0,
+                 additionalFiles=0, patches=False):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failureRate = failureRate
+        self.throttleEvery = throttleEvery
+        self.bandwidth = bandwidth
+        self.apkSize = apkSize
+        self.resultsPerQuery = resultsPerQuery
+        self.recordedDir = recordedDir
+        self.additionalFiles = additionalFiles
+        self.patches = patches
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._signatures = {}
+        self.httpd = None
+
+    @property
+    def url(self):
+        return "http://%s:%d" % (self.httpd.server_address[0], self.httpd.server_address[1])
+
+    def start(self):
+        self.httpd = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.httpd.mock = self
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logging.info("Mock Play server listening on %s" % self.url)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def configure(self, api):
+        """Point a GooglePlayAPI instance at this server."""
+        return configureApi(api, self.url)
+
+    @staticmethod
+    def recordingPath(recordedDir, path):
+        """Where a recorded ResponseWrapper for fdfe path (e.g. 'details?doc=x')
+        is looked up."""
+        return os.path.join(recordedDir, quote(path, safe="") + ".pb")
+
+    # Synthesized content
+
+    def _hash(self, text, modulo):
+        return int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16) % modulo
+
+    def versionCode(self, packageName):
+        return 1 + self._hash(packageName, 1000000)
+
+    def apkChunks(self, packageName, versionCode, start=0):
+        """Deterministic APK bytes for a package version, from offset start,
+        generated chunk by chunk so that large APKs are never held in memory."""
+        block = hashlib.sha256(("%s-%d" % (packageName, versionCode)).encode("utf-8")).digest() * 2048
+        offset = start
+        while offset < self.apkSize:
+            i = offset % len(block)
+            data = block[i:i + self.apkSize - offset]
+            offset += len(data)
+            yield data
+
+    def apk(self, packageName, versionCode):
+        return b"".join(self.apkChunks(packageName, versionCode))
+
+    def signature(self, packageName, versionCode):
+        """Like the real AndroidAppDeliveryData.signature: unpadded url-safe
+        base64 of the SHA-1 of the APK."""
+        key = (packageName, versionCode)
+        with self._lock:
+            signature = self._signatures.get(key)
+        if signature is None:
+            sha1 = hashlib.sha1()
+            for chunk in self.apkChunks(packageName, versionCode):
+                sha1.update(chunk)
+            signature = base64.urlsafe_b64encode(sha1.digest()).decode("ascii").rstrip("=")
+            with self._lock:
+                self._signatures[key] = signature
+        return signature
+
+    def patch(self, packageName, versionCode, baseVersionCode):
+        """GDIFF patch from the base version's APK to versionCode's: the
+        synthetic APKs share no content, so it is all DATA commands."""
+        data = self.apk(packageName, versionCode)
+        patch = [b"\xd1\xff\xd1\xff\x04"]
+        for i in range(0, len(data), 1 << 16):
+            block = data[i:i + (1 << 16)]
+            patch.append(struct.pack(">Bi", 248, len(block)))
+            patch.append(block)
+        patch.append(b"\x00")
+        return b"".join(patch)
+
+    def doc(self, packageName):
+        doc = googleplay_pb2.DocV2()
+        doc.docid = packageName
+        doc.backendDocid = packageName
+        doc.docType = 1
+        doc.title = "Mock app %s" % packageName
+        doc.creator = "Mock developer %d" % self._hash(packageName, 100)
+        offer = doc.offer.add()
+        offer.micros = 0
+        offer.currencyCode = "USD"
+        offer.formattedAmount = "Free"
+        offer.offerType = 1
+        details = doc.details.appDetails
+        details.developerName = doc.creator
+        details.versionCode = self.versionCode(packageName)
+        details.versionString = "1.%d" % details.versionCode
+        details.title = doc.title
+        details.appCategory.append(CATEGORIES[self._hash(packageName, len(CATEGORIES))])
+        details.installationSize = self.apkSize
+        details.permission.extend(["android.permission.INTERNET", "android.permission.ACCESS_NETWORK_STATE"])
+        details.numDownloads = "%s+" % "{:,}".format(10 ** (1 + self._hash(packageName, 8)))
+        details.packageName = packageName
+        details.uploadDate = "Mar %d, 2017" % (1 + self._hash(packageName, 28))
+        doc.aggregateRating.type = 2
+        doc.aggregateRating.starRating = 3.0 + self._hash(packageName, 20) / 10.0
+        return doc
+
+    def _container(self, wrapper, response, prefix, path, query):
+        # A paginated container of synthetic apps, linking to the next page like the real server
+        n = int(query.get("n", ["20"])[0])
+        o = int(query.get("o", ["0"])[0])
+        container = response.doc.add()
+        container.docid = prefix
+        for i in range(o, min(o + n, self.resultsPerQuery)):
+            container.child.add().CopyFrom(self.doc("%s.app%d" % (prefix, i)))
+        if o + n < self.resultsPerQuery:
+            params = dict((k, v[0]) for (k, v) in query.items())
+            params.update({"n": str(n), "o": str(o + n)})
+            container.containerMetadata.nextPageUrl = "%s?%s" % (path, "&".join("%s=%s" % (k, quote(v)) for (k, v) in sorted(params.items())))
+        return wrapper
+
+    def respond(self, method, path, query, body):
+        """ResponseWrapper for an fdfe request."""
+        wrapper = googleplay_pb2.ResponseWrapper()
+        payload = wrapper.payload
+        if path == "details":
+            payload.detailsResponse.docV2.CopyFrom(self.doc(query["doc"][0]))
+        elif path == "bulkDetails":
+            request = googleplay_pb2.BulkDetailsRequest.FromString(body)
+            for docid in request.docid:
+                payload.bulkDetailsResponse.entry.add().doc.CopyFrom(self.doc(docid))
+        elif path == "search":
+            prefix = "com.search.%s" % "".join(c for c in query["q"][0].lower() if c.isalnum())
+            self._container(wrapper, payload.searchResponse, prefix, path, query)
+        elif path == "browse":
+            for cat in CATEGORIES:
+                link = payload.browseResponse.category.add()
+                link.name = cat.title()
+                link.dataUrl = "browse?c=3&cat=%s" % cat
+        elif path == "list":
+            cat = query["cat"][0]
+            if "ctr" not in query:
+                for ctr in SUBCATEGORIES:
+                    sub = payload.listResponse.doc.add()
+                    sub.docid = ctr
+                    sub.title = ctr.replace("_", " ")
+            else:
+                prefix = "com.%s.%s" % (cat.lower(), query["ctr"][0].replace("_", ""))
+                self._container(wrapper, payload.listResponse, prefix, path, query)
+        elif path == "rev":
+            payload.reviewResponse.SetInParent()
+        elif path == "purchase":
+            form = urlparse.parse_qs(body.decode("utf-8"))
+            packageName = form["doc"][0]
+            versionCode = int(form["vc"][0])
+            delivery = payload.buyResponse.purchaseStatusResponse.appDeliveryData
+            delivery.downloadSize = self.apkSize
+            delivery.signature = self.signature(packageName, versionCode)
+            delivery.downloadUrl = "%s/cdn/%s/%d.apk" % (self.url, packageName, versionCode)
+            cookie = delivery.downloadAuthCookie.add()
+            cookie.name = "MarketDA"
+            cookie.value = "mock"
+            patchFormats = [int(pf) for pf in form.get("pf", [])]
+            if self.patches and "bvc" in form and (1 in patchFormats or 2 in patchFormats):
+                # Gzipped GDIFF when the client takes it, like the real store
+                baseVersionCode = int(form["bvc"][0])
+                patchFormat = 2 if 2 in patchFormats else 1
+                patchData = delivery.patchData
+                patchData.baseVersionCode = baseVersionCode
+                patchData.baseSignature = self.signature(packageName, baseVersionCode)
+                patchData.downloadUrl = "%s/cdn/%s/%d-%d.gdiff%d" % (self.url, packageName, versionCode, baseVersionCode, patchFormat)
+                patchData.patchFormat = patchFormat
+                patchData.maxPatchSize = len(self._patchData(packageName, versionCode, baseVersionCode, patchFormat))
+            for fileType in range(self.additionalFiles):
+                # Served by the CDN like an APK of the pseudo package <package>.obb<fileType>
+                additionalFile = delivery.additionalFile.add()
+                additionalFile.fileType = fileType
+                additionalFile.versionCode = versionCode
+                additionalFile.size = self.apkSize
+                additionalFile.downloadUrl = "%s/cdn/%s.obb%d/%d.obb" % (self.url, packageName, fileType, versionCode)
+        else:
+            return None
+        return wrapper
+
+    def _patchData(self, packageName, versionCode, baseVersionCode, patchFormat):
+        data = self.patch(packageName, versionCode, baseVersionCode)
+        if patchFormat == 2:
+            gzipper = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            data = gzipper.compress(data) + gzipper.flush()
+        return data
+
+    def nextFault(self):
+        """Status code to inject for the next request, or None."""
+        time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self.throttleEvery and self.requests % self.throttleEvery == 0:
+                return 429
+            if self.failureRate and self.random.random() < self.failureRate:
+                return 500
+        return None
+
+def configureApi(api, url):
+    """Point a GooglePlayAPI instance at the mock server at url."""
+    api.URL_LOGIN = "%s/auth" % url
+    api.URL_FDFE = "%s/fdfe" % url
+    return api
+
+class MockPlayServerProcess(object):
+    """A MockPlayServer run in a child process, so that its CPU time and
+    memory are kept out of measurements of the client. Same start(), stop(),
+    url and configure() as MockPlayServer."""
+
+    def __init__(self, latency=0.0, apkSize=1 << 20):
+        self.latency = latency
+        self.apkSize = apkSize
+        self.process = None
+        self.url = None
+
+    def start(self):
+        # From the directory holding googleplay_api, whatever the caller's working directory
+        checkout = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = subprocess.Popen([sys.executable, "-m", "googleplay_api.mockserver",
+                                         "0", str(self.latency), str(self.apkSize)],
+                                        stdout=subprocess.PIPE, cwd=checkout)
+        line = self.process.stdout.readline().decode("utf-8")
+        if " on " not in line:
+            self.stop()
+            raise RuntimeError("Mock Play server failed to start")
+        self.url = line.split(" on ", 1)[1].split()[0]
+        return self
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+    def configure(self, api):
+        return configureApi(api, self.url)
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, every
+    # keep-alive request would stall on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("mock: " + format % args)
+
+    def _send(self, status, body=b"", contentType="application/octet-stream", headers=None, compressible=False):
+        if compressible and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            gzipper = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = gzipper.compress(body) + gzipper.flush()
+            headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for (k, v) in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        mock = self.server.mock
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        fault = mock.nextFault()
+        if fault is not None:
+            return self._send(fault, b"injected failure", "text/plain")
+
+        parsed = urlparse.urlparse(self.path)
+        if parsed.path == "/auth":
+            return self._send(200, b"SID=mock\nLSID=mock\nAuth=mock-auth-token\n", "text/plain", compressible=True)
+        if parsed.path.startswith("/cdn/"):
+            return self._cdn(mock, parsed.path)
+        if not parsed.path.startswith("/fdfe/"):
+            return self._send(404, b"not found", "text/plain")
+
+        fdfePath = self.path[len("/fdfe/"):]
+        endpoint = parsed.path[len("/fdfe/"):]
+        data = None
+        if mock.recordedDir is not None:
+            recording = MockPlayServer.recordingPath(mock.recordedDir, fdfePath)
+            if os.path.exists(recording):
+                with open(recording, "rb") as f:
+                    data = f.read()
+        if data is None:
+            wrapper = mock.respond(self.command, endpoint, urlparse.parse_qs(parsed.query), body)
+            if wrapper is None:
+                return self._send(404, b"unknown endpoint", "text/plain")
+            data = wrapper.SerializeToString()
+
+        # Validators, so conditional requests can be exercised too
+        etag = '"%s"' % hashlib.sha1(data).hexdigest()
+        if self.command == "GET" and self.headers.get("If-None-Match") == etag:
+            return self._send(304, b"", headers={"ETag": etag})
+        return self._send(200, data, "application/x-protobuf", {"ETag": etag}, compressible=True)
+
+    def _cdn(self, mock, path):
+        if "MarketDA=" not in (self.headers.get("Cookie") or ""):
+            return self._send(403, b"missing download cookie", "text/plain")
+        (packageName, apkName) = path[len("/cdn/"):].rsplit("/", 1)
+        if ".gdiff" in apkName:
+            # <versionCode>-<baseVersionCode>.gdiff<patchFormat>
+            (versions, patchFormat) = apkName.split(".gdiff")
+            (versionCode, baseVersionCode) = [int(v) for v in versions.split("-")]
+            return self._send(200, mock._patchData(packageName, versionCode, baseVersionCode, int(patchFormat)))
+        versionCode = int(apkName.split(".")[0])
+        size = mock.apkSize
+
+        start = 0
+        status = 200
+        headers = {}
+        rangeHeader = self.headers.get("Range")
+        if rangeHeader and rangeHeader.startswith("bytes="):
+            start = int(rangeHeader[len("bytes="):].split("-")[0])
+            status = 206
+            headers["Content-Range"] = "bytes %d-%d/%d" % (start, size - 1, size)
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/vnd.android.package-archive")
+        self.send_header("Content-Length", str(max(0, size - start)))
+        for (k, v) in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+
+        for chunk in mock.apkChunks(packageName, versionCode, start):
+            self.wfile.write(chunk)
+            if mock.bandwidth:
+                time.sleep(len(chunk) / float(mock.bandwidth))
+
+def main(argv):
+    """Run a mock server in the foreground: mockserver.py [port] [latency] [apkSize]"""
+    logging.basicConfig(level=logging.INFO)
+    port = int(argv[1]) if len(argv) >= 2 else 8000
+    latency = float(argv[2]) if len(argv) >= 3 else 0.0
+    apkSize = int(argv[3]) if len(argv) >= 4 else 1 << 20
+    server = MockPlayServer(port=port, latency=latency, apkSize=apkSize).start()
+    print("Mock Play server on %s (Ctrl-C to stop)" % server.url)
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main(sys.argv)
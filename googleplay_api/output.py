@@ -0,0 +1,107 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import sys
+import json
+
+FORMATS = ("csv", "jsonl")
+
+class ResultWriter(object):
+    """Writes result rows to a buffered stream, either as separator-delimited
+    text (the scripts' historical output) or as JSON Lines, one object per
+    row, ready to be piped into ingestion without ad-hoc CSV parsing."""
+
+    def __init__(self, format="csv", separator=";", stream=None, bufferSize=1 << 16):
+        if format not in FORMATS:
+            raise ValueError("Unknown output format %s, expected one of %s" % (format, ", ".join(FORMATS)))
+        self.format = format
+        self.jsonl = (format == "jsonl")
+        self.separator = separator
+
+        if stream is None:
+            if sys.version_info[0] >= 3: # python 3
+                # Own buffer instead of stdout's line buffering when attached to a terminal
+                stream = io.open(sys.stdout.fileno(), "w", buffering=bufferSize,
+                                 encoding="utf-8", closefd=False)
+            else: # Python 2, stdout is already block buffered by stdio
+                stream = sys.stdout
+        self.stream = stream
+
+    def writeHeader(self, labels):
+        """Column titles; only written in csv format."""
+        if not self.jsonl:
+            print(*labels, sep=self.separator, file=self.stream)
+
+    def writeRow(self, values):
+        """One separator-delimited row (csv format)."""
+        print(*values, sep=self.separator, file=self.stream)
+
+    def writeRecord(self, record):
+        """One JSON object (jsonl format)."""
+        self.stream.write(json.dumps(record))
+        self.stream.write("\n")
+
+    def write(self, keys, values):
+        """A row in whichever format is selected, keys naming the JSON fields."""
+        if self.jsonl:
+            self.writeRecord(dict(zip(keys, values)))
+        else:
+            self.writeRow(values)
+
+    def flush(self):
+        self.stream.flush()
+
+def str_compat(text):
+    if sys.version_info[0] >= 3: # python 3
+        return text
+    else: # Python 2
+        return text.encode('utf8')
+
+def sizeof_fmt(num):
+    for x in ['bytes','KB','MB','GB','TB']:
+        if num < 1024.0:
+            return "%3.1f%s" % (num, x)
+        num /= 1024.0
+
+RESULT_COLUMNS = [ ("title", "Title"),
+                ("packageName", "Package name"),
+                ("creator", "Creator"),
+                ("superDev", "Super Dev"),
+                ("price", "Price"),
+                ("offerType", "Offer Type"),
+                ("versionCode", "Version Code"),
+                ("size", "Size"),
+                ("rating", "Rating"),
+                ("numDownloads", "Num Downloads"),
+             ]
+
+def resultRecord(c):
+    """The RESULT_COLUMNS of an app (DocV2) as raw values, for jsonl."""
+    return { "title": c.title,
+            "packageName": c.docid,
+            "creator": c.creator,
+            "superDev": len(c.annotations.badgeForCreator) > 0,
+            "price": c.offer[0].formattedAmount,
+            "offerType": c.offer[0].offerType,
+            "versionCode": c.details.appDetails.versionCode,
+            "size": c.details.appDetails.installationSize,
+            "rating": c.aggregateRating.starRating,
+            "numDownloads": c.details.appDetails.numDownloads }
+
+def resultRow(c):
+    """The RESULT_COLUMNS of an app (DocV2) formatted for display, for csv."""
+    return [ str_compat(c.title),
+            c.docid,
+            str_compat(c.creator),
+            len(c.annotations.badgeForCreator), # Is Super Developer?
+            c.offer[0].formattedAmount,
+            c.offer[0].offerType,
+            c.details.appDetails.versionCode,
+            sizeof_fmt(c.details.appDetails.installationSize),
+            "%.2f" % c.aggregateRating.starRating,
+            c.details.appDetails.numDownloads]
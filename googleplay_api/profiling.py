@@ -0,0 +1,196 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import os
+import sys
+import glob
+import time
+import atexit
+import threading
+import multiprocessing
+from multiprocessing import util
+
+DEFAULT_PATH = "profile.folded"
+
+# Path of the profile started by profileOnExit(), for profileWorker()
+_profilePath = None
+
+# Where a sample's leaf frame sits decides what the thread was doing. A thread
+# blocked in a C call (recv, connect, getaddrinfo, a lock) shows the Python
+# frame that made the call, so these are matched on the calling frames.
+_NETWORK_FILES = ("socket.py", "ssl.py", "selectors.py", os.path.join("http", "client.py"),
+                  "httplib.py", os.path.join("urllib3", "util", "connection.py"),
+                  os.path.join("urllib3", "util", "wait.py"))
+_IDLE_FUNCTIONS = ("wait", "sleep", "join", "acquire", "get", "_wait_for_tstate_lock")
+_IDLE_FILES = ("threading.py", "queue.py", "Queue.py", os.path.join("multiprocessing", "pool.py"))
+
+def _category(frames):
+    """frames runs from the outermost call to the leaf."""
+    (leafFile, leafFunction) = frames[-1][:2]
+    if leafFile.endswith(_NETWORK_FILES):
+        return "network"
+    if leafFile.endswith(_IDLE_FILES) and leafFunction in _IDLE_FUNCTIONS:
+        return "idle"
+    for (filename, function, _) in reversed(frames):
+        if function == "toDict":
+            return "cpu-toDict"
+        if "google" + os.sep + "protobuf" in filename:
+            return "cpu-protobuf"
+        if "lxml" + os.sep in filename or function in ("fromstring", "parse_app_page"):
+            return "cpu-lxml"
+    return "cpu-other"
+
+class SamplingProfiler(object):
+    """Samples the stacks of every thread each interval seconds from a
+    background thread.
+
+    write() produces folded stacks ("frame;frame;frame count" lines), the
+    input of flamegraph.pl and speedscope. The root frame of each stack is
+    its category: network (waiting on a socket), idle (waiting on another
+    thread or sleeping), or CPU time split into cpu-protobuf, cpu-toDict,
+    cpu-lxml and cpu-other."""
+
+    def __init__(self, interval=0.005, label=None):
+        self.interval = interval
+        self.label = label
+        self.stacks = {}
+        self.categories = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.elapsed = time.time() - self.started
+
+    def _run(self):
+        me = threading.current_thread().ident
+        while not self._stop.wait(self.interval):
+            names = dict((t.ident, t.name) for t in threading.enumerate())
+            for (ident, frame) in sys._current_frames().items():
+                if ident != me:
+                    self._sample(names.get(ident, "thread-%d" % ident), frame)
+
+    def _sample(self, threadName, frame):
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_filename, code.co_name, frame.f_lineno or 0))
+            frame = frame.f_back
+        if not frames:
+            return
+        frames.reverse()
+        if self.label is not None:
+            threadName = "%s/%s" % (self.label, threadName)
+        category = _category(frames)
+        stack = ";".join([category, threadName] +
+                         ["%s (%s:%d)" % (function, os.path.basename(filename), line)
+                          for (filename, function, line) in frames])
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self.samples += 1
+
+    def write(self, path):
+        with io.open(path, "w", encoding="utf-8") as f:
+            for (stack, count) in sorted(self.stacks.items()):
+                f.write("%s %d\n" % (stack, count))
+
+    def merge(self, path):
+        """Add the stacks of another profile written by write()."""
+        with io.open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                (stack, count) = line.rstrip("\n").rsplit(" ", 1)
+                category = stack.split(";", 1)[0]
+                self.stacks[stack] = self.stacks.get(stack, 0) + int(count)
+                self.categories[category] = self.categories.get(category, 0) + int(count)
+                self.samples += int(count)
+
+    def summary(self):
+        """Approximate seconds per category, summed over threads."""
+        return dict((category, count * self.interval)
+                    for (category, count) in self.categories.items())
+
+def _workerPaths(path):
+    return glob.glob(glob.escape(path) + ".worker-*") if hasattr(glob, "escape") else glob.glob(path + ".worker-*")
+
+def profileOnExit(path, interval=0.005, stream=None):
+    """Start a SamplingProfiler now; when the interpreter exits, write its
+    folded stacks to path and a per-category summary to stream (default
+    stderr). The stacks of worker processes sampled with profileWorker()
+    are merged in."""
+    global _profilePath
+    for stale in _workerPaths(path):
+        os.remove(stale)
+    _profilePath = path
+    profiler = SamplingProfiler(interval).start()
+
+    def finish():
+        profiler.stop()
+        for workerPath in _workerPaths(path):
+            profiler.merge(workerPath)
+            os.remove(workerPath)
+        profiler.write(path)
+        out = stream or sys.stderr
+        out.write("Profile: %d samples over %.1fs written to %s\n" % (profiler.samples, profiler.elapsed, path))
+        for (category, seconds) in sorted(profiler.summary().items(), key=lambda item: -item[1]):
+            out.write("  %-14s %8.2fs\n" % (category, seconds))
+
+    atexit.register(finish)
+    return profiler
+
+def currentPath():
+    """Path of the profile started by profileOnExit(), or None."""
+    return _profilePath
+
+def profileWorker(path, interval=0.005):
+    """Sample this worker process (a multiprocessing.Pool initializer or
+    Process target) when path, the parent's currentPath(), is not None. Its
+    stacks are written next to path when the worker exits normally, and
+    merged into the parent's profile when that one exits."""
+    if path is None:
+        return
+    name = multiprocessing.current_process().name
+    profiler = SamplingProfiler(interval, label=name).start()
+
+    def finish():
+        profiler.stop()
+        profiler.write("%s.worker-%d" % (path, os.getpid()))
+
+    # Pool workers leave through os._exit(), skipping atexit; multiprocessing
+    # finalizers still run
+    util.Finalize(None, finish, exitpriority=100)
+    return profiler
+
+def startProfile(argv, path=DEFAULT_PATH):
+    """Remove a --profile[=path] option from argv and, if it was given,
+    sample the run with profileOnExit(), writing to path (default
+    profile.folded). Returns the remaining arguments."""
+    remaining = []
+    profilePath = None
+    for arg in argv:
+        if arg == "--profile":
+            profilePath = path
+        elif arg.startswith("--profile="):
+            profilePath = arg.split("=", 1)[1]
+        else:
+            remaining.append(arg)
+    if profilePath is not None:
+        profileOnExit(profilePath)
+    return remaining
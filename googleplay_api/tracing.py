@@ -0,0 +1,251 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import time
+import socket
+import threading
+
+from requests.adapters import HTTPAdapter
+try:
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+except ImportError:
+    # Older requests vendor their own urllib3
+    from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+    from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# The span being recorded on this thread, if any; read by the traced connections below
+_local = threading.local()
+
+def currentSpan():
+    return getattr(_local, "span", None)
+
+class Span(object):
+    """Timing breakdown of one request. phases holds (name, start offset,
+    duration) tuples in seconds, e.g. dns, connect, tls, ttfb, body, decode."""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.end = None
+        self.phases = []
+        self.error = None
+
+    def record(self, phase, duration, start=None):
+        offset = (start if start is not None else time.time() - duration) - self.start
+        self.phases.append((phase, offset, duration))
+
+    def phaseTotal(self, *names):
+        return sum(duration for (phase, _, duration) in self.phases if phase in names)
+
+    def toDict(self):
+        return {"name": self.name,
+                "attributes": self.attributes,
+                "start": self.start,
+                "duration": (self.end or time.time()) - self.start,
+                "phases": [{"name": phase, "offset": offset, "duration": duration}
+                           for (phase, offset, duration) in self.phases],
+                "error": self.error}
+
+class _Activation(object):
+    def __init__(self, span):
+        self.span = span
+
+    def __enter__(self):
+        self.parent = currentSpan()
+        _local.span = self.span
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.span = self.parent
+        if exc_type is not None and self.span.error is None:
+            self.span.error = "%s: %s" % (exc_type.__name__, exc_value)
+
+class _SpanContext(_Activation):
+    def __init__(self, tracer, span):
+        _Activation.__init__(self, span)
+        self.tracer = tracer
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _Activation.__exit__(self, exc_type, exc_value, traceback)
+        self.tracer.finish(self.span)
+
+class _PhaseContext(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        span = currentSpan()
+        if span is not None:
+            span.record(self.name, time.time() - self.start, self.start)
+
+class _NullContext(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_CONTEXT = _NullContext()
+
+class Tracer(object):
+    """Records request spans and hands them to a sink (see JsonlSink and
+    OpenTelemetrySink) when they finish.
+
+    span() covers the common case of a span over one block. A span that
+    outlives a block, such as a download streamed by a generator, is driven
+    with start(), activate() around the blocks doing its I/O, and finish()."""
+
+    enabled = True
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def span(self, name, **attributes):
+        return _SpanContext(self, Span(name, attributes))
+
+    def start(self, name, **attributes):
+        return Span(name, attributes)
+
+    def activate(self, span):
+        return _Activation(span)
+
+    def finish(self, span):
+        span.end = time.time()
+        self.sink.emit(span)
+
+    def phase(self, name):
+        return _PhaseContext(name)
+
+class NullTracer(object):
+    """Tracing disabled: every call is a no-op and spans are None."""
+
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _NULL_CONTEXT
+
+    def start(self, name, **attributes):
+        return None
+
+    def activate(self, span):
+        return _NULL_CONTEXT
+
+    def finish(self, span):
+        pass
+
+    def phase(self, name):
+        return _NULL_CONTEXT
+
+NULL_TRACER = NullTracer()
+
+def recordTtfb(span, sent):
+    """Record the time from sending a request at sent until its response
+    headers arrived, less whatever went into setting up the connection."""
+    if span is None:
+        return
+    setup = span.phaseTotal("dns", "connect", "tls")
+    span.record("ttfb", max(0.0, time.time() - sent - setup), sent + setup)
+
+class JsonlSink(object):
+    """Appends one JSON object per span to a file."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.f = io.open(path, "ab")
+
+    def emit(self, span):
+        line = json.dumps(span.toDict(), sort_keys=True).encode("utf-8") + b"\n"
+        with self._lock:
+            self.f.write(line)
+            self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+class OpenTelemetrySink(object):
+    """Re-emits spans through the OpenTelemetry API (the opentelemetry-api
+    package must be installed and an SDK configured), with one child span per
+    phase."""
+
+    def __init__(self, tracerName="googleplay_api"):
+        from opentelemetry import trace
+        self.trace = trace
+        self.tracer = trace.get_tracer(tracerName)
+
+    def emit(self, span):
+        ns = lambda seconds: int(seconds * 1e9)
+        parent = self.tracer.start_span(span.name, start_time=ns(span.start),
+                                        attributes=dict((k, "%s" % v) for (k, v) in span.attributes.items()))
+        context = self.trace.set_span_in_context(parent)
+        for (phase, offset, duration) in span.phases:
+            child = self.tracer.start_span(phase, context=context, start_time=ns(span.start + offset))
+            child.end(end_time=ns(span.start + offset + duration))
+        if span.error is not None:
+            parent.set_attribute("error", span.error)
+        parent.end(end_time=ns(span.end))
+
+class _TracedConnectionMixin(object):
+    """Splits connection setup into dns and connect phases by resolving the
+    host itself, then letting urllib3 connect to the resolved address."""
+
+    def _new_conn(self):
+        span = currentSpan()
+        if span is None:
+            return super(_TracedConnectionMixin, self)._new_conn()
+
+        start = time.time()
+        infos = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        resolved = time.time()
+        span.record("dns", resolved - start, start)
+
+        host = self._dns_host
+        self._dns_host = infos[0][4][0]
+        try:
+            conn = super(_TracedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = host
+        span.record("connect", time.time() - resolved, resolved)
+        return conn
+
+class _TracedHTTPConnection(_TracedConnectionMixin, HTTPConnection):
+    pass
+
+class _TracedHTTPSConnection(_TracedConnectionMixin, HTTPSConnection):
+    def connect(self):
+        span = currentSpan()
+        if span is None:
+            return HTTPSConnection.connect(self)
+
+        start = time.time()
+        setup = span.phaseTotal("dns", "connect")
+        HTTPSConnection.connect(self)
+        # Whatever connect() spent beyond dns and TCP connect went into the TLS handshake
+        handshake = time.time() - start - (span.phaseTotal("dns", "connect") - setup)
+        span.record("tls", handshake)
+
+class _TracedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TracedHTTPConnection
+
+class _TracedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TracedHTTPSConnection
+
+class TracingAdapter(HTTPAdapter):
+    """requests transport adapter whose new connections record dns, connect
+    and tls phases into the current span. Mount it on a Session."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TracedHTTPPool,
+                                                   "https": _TracedHTTPSPool}
@@ -0,0 +1,93 @@
+# vim: tabstop=8 expandtab shiftwidth=4 softtabstop=4
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import io
+import json
+import hashlib
+import tempfile
+
+class ValidatorCache(object):
+    """On-disk store of HTTP cache validators (ETag / Last-Modified), keyed
+    by request path or URL.
+
+    Alongside the validators it keeps the last full response body, so that a
+    304 Not Modified can be answered from disk, and optionally a caller
+    supplied record (e.g. the metadata extracted from that body) so unchanged
+    responses don't even need to be parsed again."""
+
+    def __init__(self, root):
+        self.root = root
+        if not os.path.isdir(root):
+            os.makedirs(root)
+
+    def _path(self, key, suffix):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+
+    def get(self, key):
+        """Return the stored entry for key as a dict (with 'etag',
+        'lastModified' and 'record'), or None if nothing is stored."""
+        path = self._path(key, ".json")
+        if not os.path.exists(path):
+            return None
+        with io.open(path, "rb") as f:
+            return json.loads(f.read().decode("utf-8"))
+
+    def conditionalHeaders(self, key):
+        """Headers to send to revalidate the cached copy of key."""
+        entry = self.get(key)
+        headers = {}
+        if entry is None or not os.path.exists(self._path(key, ".body")):
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers
+
+    def body(self, key):
+        """The last full response body stored for key."""
+        with io.open(self._path(key, ".body"), "rb") as f:
+            return f.read()
+
+    def put(self, key, body, etag=None, lastModified=None):
+        """Store a fresh response. Any record derived from the previous body
+        is dropped, since it no longer matches."""
+        if etag is None and lastModified is None:
+            # Nothing to revalidate with; forget any stale copy
+            for suffix in (".json", ".body"):
+                if os.path.exists(self._path(key, suffix)):
+                    os.remove(self._path(key, suffix))
+            return
+        self._write(self._path(key, ".body"), body)
+        entry = {"etag": etag, "lastModified": lastModified, "record": None}
+        self._write(self._path(key, ".json"), json.dumps(entry).encode("utf-8"))
+
+    def record(self, key):
+        """The record attached to the current body of key, if any."""
+        entry = self.get(key)
+        if entry is None:
+            return None
+        return entry.get("record")
+
+    def setRecord(self, key, record):
+        """Attach a (JSON serializable) record to the current body of key."""
+        entry = self.get(key)
+        if entry is None:
+            return
+        entry["record"] = record
+        self._write(self._path(key, ".json"), json.dumps(entry).encode("utf-8"))
@@ -6,56 +6,48 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import sys
+import atexit
 
 from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.output import ResultWriter, FORMATS, RESULT_COLUMNS, resultRecord, resultRow, str_compat, sizeof_fmt
 
 config = None
-
-def str_compat(text):
-    if sys.version_info[0] >= 3: # python 3
-        return text
-    else: # Python 2
-        return text.encode('utf8')
-
-
-def sizeof_fmt(num):
-    for x in ['bytes','KB','MB','GB','TB']:
-        if num < 1024.0:
-            return "%3.1f%s" % (num, x)
-        num /= 1024.0
+writer = None
+output_format = None
+
+def pop_output_format(argv):
+    """Remove a --format=csv|jsonl option from argv, so the scripts' positional
+    argument parsing is unaffected. Without it, OUTPUT_FORMAT from config.py
+    (default: csv) is used."""
+    global output_format
+    remaining = []
+    for arg in argv:
+        if arg.startswith("--format="):
+            output_format = arg.split("=", 1)[1]
+            if output_format not in FORMATS:
+                print("Error: unknown output format %s, use one of %s" % (output_format, ", ".join(FORMATS)))
+                sys.exit(1)
+        else:
+            remaining.append(arg)
+    return remaining
+
+def get_writer():
+    global config, writer
+    if writer is None:
+        if config == None:
+            config = GooglePlayAPI.read_config()
+        fmt = output_format or config.get('OUTPUT_FORMAT', "csv")
+        writer = ResultWriter(fmt, config.get('SEPARATOR', ";"))
+        atexit.register(writer.flush)
+    return writer
 
 def print_header_line():
-    global config
-    if config == None:
-        config = GooglePlayAPI.read_config()
-
-    l = [ "Title",
-                "Package name",
-                "Creator",
-                "Super Dev",
-                "Price",
-                "Offer Type",
-                "Version Code",
-                "Size",
-                "Rating",
-                "Num Downloads",
-             ]
-    print(*l, sep=config['SEPARATOR'])
+    get_writer().writeHeader([label for (_, label) in RESULT_COLUMNS])
 
 def print_result_line(c):
-    global config
-    if config == None:
-        config = GooglePlayAPI.read_config()
-
-    l = [ str_compat(c.title),
-                c.docid,
-                str_compat(c.creator),
-                len(c.annotations.badgeForCreator), # Is Super Developer?
-                c.offer[0].formattedAmount,
-                c.offer[0].offerType,
-                c.details.appDetails.versionCode,
-                sizeof_fmt(c.details.appDetails.installationSize),
-                "%.2f" % c.aggregateRating.starRating,
-                c.details.appDetails.numDownloads]
-    print(*l, sep=config['SEPARATOR'])
-
+    w = get_writer()
+    if w.jsonl:
+        # Raw values rather than their display formatting
+        w.writeRecord(resultRecord(c))
+    else:
+        w.writeRow(resultRow(c))
@@ -11,9 +11,12 @@ import sys
 
 import helpers
 from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api import profiling
+
+sys.argv = profiling.startProfile(helpers.pop_output_format(sys.argv))
 
 if (len(sys.argv) < 2):
-    print("Usage: %s category [subcategory] [nb_results] [offset]" % sys.argv[0])
+    print("Usage: %s category [subcategory] [nb_results] [offset] [--format=csv|jsonl] [--profile[=path]]" % sys.argv[0])
     print("List subcategories and apps within them.")
     print("category: To obtain a list of supported catagories, use categories.py")
     print("subcategory: You can get a list of all subcategories available, by supplying a valid category")
@@ -45,9 +48,13 @@ except:
     sys.exit(1)
 
 if (ctr is None):
-    print("Subcategory ID", "Name", sep=config['SEPARATOR'])
+    writer = helpers.get_writer()
+    writer.writeHeader(["Subcategory ID", "Name"])
     for doc in message.doc:
-        print(helpers.str_compat(doc.docid), helpers.str_compat(doc.title), sep=config['SEPARATOR'])
+        if writer.jsonl:
+            writer.writeRecord({"subcategory": doc.docid, "name": doc.title})
+        else:
+            writer.writeRow([helpers.str_compat(doc.docid), helpers.str_compat(doc.title)])
 else:
     helpers.print_header_line()
     doc = message.doc[0]
@@ -18,9 +18,12 @@ except ImportError:
 
 import helpers
 from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api import profiling
+
+sys.argv = profiling.startProfile(helpers.pop_output_format(sys.argv))
 
 if (len(sys.argv) < 2):
-    print("Usage: %s packagename1 [packagename2 [...]]" % sys.argv[0])
+    print("Usage: %s packagename1 [packagename2 [...]] [--format=csv|jsonl] [--profile[=path]]" % sys.argv[0])
     print("Display permissions required to install the specified app(s).")
     sys.exit(0)
 
@@ -33,19 +36,29 @@ config = GooglePlayAPI.read_config()
 api = GooglePlayAPI(config['ANDROID_ID'])
 api.login(config['GOOGLE_LOGIN'], config['GOOGLE_PASSWORD'], config['AUTH_TOKEN'])
 
+writer = helpers.get_writer()
+
 # Only one app
 if (len(packagenames) == 1):
     response = api.details(packagenames[0])
-    for item in response.docV2.details.appDetails.permission:
-        print(helpers.str_compat(item))
+    if writer.jsonl:
+        writer.writeRecord({"packageName": packagenames[0],
+                            "permissions": list(response.docV2.details.appDetails.permission)})
+    else:
+        for item in response.docV2.details.appDetails.permission:
+            writer.writeRow([helpers.str_compat(item)])
 
 else: # More than one app
     response = api.bulkDetails(packagenames)
 
     for entry in response.entry:
         if (not not entry.ListFields()): # if the entry is not empty
-            print(entry.doc.docid + ":")
+            if writer.jsonl:
+                writer.writeRecord({"packageName": entry.doc.docid,
+                                    "permissions": list(entry.doc.details.appDetails.permission)})
+                continue
+            writer.writeRow([entry.doc.docid + ":"])
             for item in entry.doc.details.appDetails.permission:
-                print("    " + helpers.str_compat(item))
-            print()
+                writer.writeRow(["    " + helpers.str_compat(item)])
+            writer.writeRow([])
 
@@ -11,9 +11,12 @@ import sys
 
 import helpers
 from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api import profiling
+
+sys.argv = profiling.startProfile(helpers.pop_output_format(sys.argv))
 
 if (len(sys.argv) < 2):
-    print("Usage: %s request [nb_results] [offset]" % sys.argv[0])
+    print("Usage: %s request [nb_results] [offset] [--format=csv|jsonl] [--profile[=path]]" % sys.argv[0])
     print("Search for an app.")
     print("If request contains a space, don't forget to surround it with \"\"")
     sys.exit(0)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import unittest
+
+from apkfetch import apkfetch as fetch
+from apkfetch import apkstore
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.mockserver import MockPlayServer
+
+class ApkStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer(apkSize=100000).start()
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+        self.dir = tempfile.mkdtemp()
+        self.store = apkstore.ApkStore(self.dir)
+
+    def tearDown(self):
+        fetch.api = None
+        self.store.close()
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def blobs(self):
+        return [name for (_, _, names) in os.walk(self.store.blobs_dir) for name in names]
+
+    def test_download_is_indexed_by_sha256(self):
+        path = fetch.get_apk("com.example.a", 5, store=self.store)
+        digest = hashlib.sha256(self.server.apk("com.example.a", 5)).hexdigest()
+        self.assertEqual(self.store.lookup("com.example.a", 5), digest)
+        self.assertEqual(path, self.store.blob_path(digest))
+        self.assertEqual(os.listdir(self.store.tmp_dir), [])
+
+        with sqlite3.connect(os.path.join(self.dir, "index.sqlite")) as db:
+            self.assertEqual(db.execute("SELECT sha256, size FROM apks WHERE package = ? AND version_code = ?", ("com.example.a", 5)).fetchall(),
+                             [(digest, 100000)])
+
+    def test_identical_apks_share_a_blob(self):
+        data = self.server.apk("com.example.a", 5)
+        self.store.put_stream("com.example.a", 5, [data])
+        self.store.put_stream("com.example.b", 1, [data[:1000], data[1000:]])
+        self.assertEqual(self.store.lookup("com.example.a", 5), self.store.lookup("com.example.b", 1))
+        self.assertEqual(len(self.blobs()), 1)
+
+    def test_held_version_is_not_fetched_again(self):
+        fetch.get_apk("com.example.a", 5, store=self.store)
+        requests = self.server.requests
+        fetch.get_apk("com.example.a", 5, store=self.store)
+        self.assertEqual(self.server.requests, requests)
+
+    def test_versions_newest_first(self):
+        for versionCode in (3, 9, 5):
+            self.store.put_stream("com.example.a", versionCode, [self.server.apk("com.example.a", versionCode)])
+        self.assertEqual(self.store.versions("com.example.a"), [9, 5, 3])
+        self.assertEqual(self.store.versions("com.example.b"), [])
+
+    def test_index_survives_reopening(self):
+        digest = self.store.put_stream("com.example.a", 5, [b"apk"])
+        self.store.close()
+        self.store = apkstore.ApkStore(self.dir)
+        self.assertEqual(self.store.lookup("com.example.a", 5), digest)
+
+    def test_missing_blob_is_not_held(self):
+        digest = self.store.put_stream("com.example.a", 5, [b"apk"])
+        os.remove(self.store.blob_path(digest))
+        self.assertIsNone(self.store.lookup("com.example.a", 5))
+        self.assertIsNone(self.store.path("com.example.a", 5))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from apkfetch import apkfetch as fetch
+from apkfetch import cli
+from googleplay_api import googleplay
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.mockserver import MockPlayServer
+
+class CliTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer().start()
+        # init_api() keeps an API that is already set up, so main() uses the mock
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+
+        self.dir = tempfile.mkdtemp()
+        self.config = os.path.join(self.dir, "config.py")
+        with open(self.config, "w") as f:
+            f.write("ANDROID_ID = '0'\nGOOGLE_LOGIN = 'a@b'\nGOOGLE_PASSWORD = 'x'\nAUTH_TOKEN = 'mock'\n")
+        googleplay.config = None
+
+    def tearDown(self):
+        fetch.api = None
+        googleplay.config = None
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def run_main(self, argv):
+        # The writer opens its own stream on sys.stdout's file descriptor
+        out = os.path.join(self.dir, "out")
+        stdout = sys.stdout
+        with open(out, "w") as sys.stdout:
+            try:
+                status = cli.main(["--config", self.config, "--format", "jsonl"] + argv)
+            finally:
+                sys.stdout = stdout
+        with open(out) as f:
+            return (status, [json.loads(line) for line in f if line.strip()])
+
+    def test_search(self):
+        (status, records) = self.run_main(["search", "earth", "-n", "5"])
+        self.assertEqual(status, 0)
+        self.assertEqual(len(records), 5)
+        self.assertEqual(records[0]["query"], "earth")
+
+    def test_details(self):
+        (status, records) = self.run_main(["details", "com.example.a", "com.example.b"])
+        self.assertEqual([r["packageName"] for r in records], ["com.example.a", "com.example.b"])
+
+    def test_download_into_store(self):
+        store = os.path.join(self.dir, "store")
+        (status, records) = self.run_main(["download", "-s", store, "com.example.a"])
+        self.assertEqual(status, 0)
+        self.assertEqual(records[0]["packageName"], "com.example.a")
+        self.assertTrue(os.path.exists(records[0]["path"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import json
+import unittest
+
+import requests
+
+from apkfetch import apkfetch as fetch
+from apkfetch import daemon
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.mockserver import MockPlayServer
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer().start()
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+        self.daemon = daemon.Daemon(workers=2)
+        self.daemon.serve_in_background()
+
+    def tearDown(self):
+        self.daemon.shutdown()
+        fetch.api = None
+        self.server.stop()
+
+    def post(self, path, body):
+        return requests.post(self.daemon.address + path, data=body, headers={"Content-Type": "application/json"})
+
+    def test_bulk_details(self):
+        resp = self.post("bulkDetails", json.dumps({"packages": ["com.example.a", "com.example.b"]}))
+        self.assertEqual(resp.status_code, 200)
+        records = [json.loads(line) for line in resp.text.splitlines()]
+        self.assertEqual([r["package"] for r in records], ["com.example.a", "com.example.b"])
+        self.assertEqual(records[0]["details"]["docid"], "com.example.a")
+
+    def test_invalid_bodies(self):
+        for body in ("not json", "[\"com.example.a\"]", "\"com.example.a\"", "{\"packages\": \"com.example.a\"}", "{}"):
+            resp = self.post("bulkDetails", body)
+            self.assertEqual(resp.status_code, 400, body)
+            self.assertIn("error", resp.json())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+from apkfetch import distributed, jobs
+
+class WorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.coordinator = distributed.Coordinator(os.path.join(self.dir, "jobs.sqlite"), lease_secs=1)
+        self.coordinator.serve_in_background()
+        self.handled = []
+
+    def tearDown(self):
+        self.coordinator.shutdown()
+        shutil.rmtree(self.dir)
+
+    def test_heartbeat_keeps_slow_package_leased(self):
+        # "a" takes longer than a lease; meanwhile the other worker keeps asking for work, and
+        # would take "a" over if its lease expired
+        self.coordinator.add(["a", "b", "c"])
+        def handler(package):
+            self.handled.append(package)
+            if package == "a":
+                time.sleep(2.5)
+        workers = [threading.Thread(target=distributed.run_worker,
+                                    args=(self.coordinator.url, handler, "worker%d" % i, 1, 0.1, 1))
+                   for i in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(sorted(self.handled), ["a", "b", "c"])
+        self.assertEqual(self.coordinator.stats()[jobs.DONE], 3)
+
+if __name__ == "__main__":
+    unittest.main()
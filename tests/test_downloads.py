@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from apkfetch import apkfetch as fetch
+from googleplay_api.googleplay import GooglePlayAPI, RequestError
+from googleplay_api.mockserver import MockPlayServer
+
+PACKAGE = "com.example.app"
+
+class MockDownloadTest(unittest.TestCase):
+    serverOptions = {}
+
+    def setUp(self):
+        self.server = MockPlayServer(apkSize=200000, **self.serverOptions).start()
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+        self.dir = tempfile.mkdtemp()
+
+        # Offsets the CDN was asked to serve APKs from, once the signature is cached
+        self.server.signature(PACKAGE, 1)
+        self.apk = self.server.apk(PACKAGE, 1)
+        self.starts = []
+        apkChunks = self.server.apkChunks
+        def recordStart(packageName, versionCode, start=0):
+            self.starts.append(start)
+            return apkChunks(packageName, versionCode, start)
+        self.server.apkChunks = recordStart
+
+    def tearDown(self):
+        fetch.api = None
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def delivery(self, package=PACKAGE, versionCode=1):
+        return fetch.api.purchase(package, versionCode)
+
+    def fetch(self, filepath, size=None, signature=None, versionCode=1):
+        delivery = self.delivery(versionCode=versionCode)
+        return fetch.fetch_resumable(delivery.downloadUrl, fetch.api.deliveryCookies(delivery), filepath,
+                                     size or delivery.downloadSize, signature or delivery.signature)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+class VerifyStreamTest(MockDownloadTest):
+    def test_passes_matching_data(self):
+        delivery = self.delivery()
+        data = b"".join(fetch.api.verifyDelivery(fetch.api.deliveryStream(delivery), delivery, PACKAGE))
+        self.assertEqual(data, self.apk)
+
+    def test_wrong_size_leaves_no_file(self):
+        path = os.path.join(self.dir, "app.apk")
+        with self.assertRaises(RequestError):
+            self.fetch(path, size=100000)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_wrong_signature_leaves_no_file(self):
+        path = os.path.join(self.dir, "app.apk")
+        with self.assertRaises(RequestError):
+            self.fetch(path, signature=self.server.signature(PACKAGE, 2))
+        self.assertEqual(os.listdir(self.dir), [])
+
+class ResumableTest(MockDownloadTest):
+    def test_resumes_from_partial_file(self):
+        path = os.path.join(self.dir, "app.apk")
+        with open(path + ".part", "wb") as f:
+            f.write(self.apk[:50000])
+
+        self.fetch(path)
+        self.assertEqual(self.read(path), self.apk)
+        self.assertEqual(self.starts, [50000])
+        self.assertFalse(os.path.exists(path + ".part"))
+
+    def test_refetches_corrupt_partial_file(self):
+        path = os.path.join(self.dir, "app.apk")
+        with open(path + ".part", "wb") as f:
+            f.write(b"\0" * 50000)
+
+        self.fetch(path)
+        self.assertEqual(self.read(path), self.apk)
+        self.assertEqual(self.starts, [50000, 0])
+
+    def test_keeps_complete_file(self):
+        path = os.path.join(self.dir, "app.apk")
+        self.fetch(path)
+        self.fetch(path)
+        self.assertEqual(self.starts, [0])
+
+    def test_concurrent_fetches_take_turns(self):
+        # The second fetch waits for the part file's lock, then finds the APK in place
+        self.server.bandwidth = 1 << 20
+        path = os.path.join(self.dir, "app.apk")
+        errors = []
+        def run():
+            try:
+                self.fetch(path)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.starts, [0])
+        self.assertEqual(self.read(path), self.apk)
+        self.assertEqual(os.listdir(self.dir), ["app.apk"])
+
+class AdditionalFilesTest(MockDownloadTest):
+    serverOptions = {"additionalFiles": 2}
+
+    def test_fetches_obbs_and_manifest(self):
+        path = fetch.get_apk(PACKAGE, 7, outdir=self.dir, additional_files=True)
+        self.assertEqual(self.read(path), self.server.apk(PACKAGE, 7))
+
+        with open(os.path.join(self.dir, "%s-7.obb.json" % PACKAGE)) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest["versionCode"], 7)
+        self.assertEqual([f["type"] for f in manifest["additionalFiles"]], ["main", "patch"])
+        for (fileType, entry) in enumerate(manifest["additionalFiles"]):
+            self.assertEqual(os.path.basename(entry["path"]), "%s.7.%s.obb" % (entry["type"], PACKAGE))
+            self.assertEqual(self.read(entry["path"]), self.server.apk("%s.obb%d" % (PACKAGE, fileType), 7))
+
+    def test_held_version_with_manifest_is_skipped(self):
+        fetch.get_apk(PACKAGE, 7, outdir=self.dir, additional_files=True)
+        requests = self.server.requests
+        fetch.get_apk(PACKAGE, 7, outdir=self.dir, additional_files=True)
+        self.assertEqual(self.server.requests, requests)
+
+if __name__ == "__main__":
+    unittest.main()
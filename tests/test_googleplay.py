@@ -0,0 +1,21 @@
+import unittest
+
+from googleplay_api.googleplay import GooglePlayAPI, RequestError
+from googleplay_api.mockserver import MockPlayServer
+
+class HttpErrorTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer(throttleEvery=1).start()
+        self.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        self.api.login(authSubToken="mock")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_throttled_request_raises_with_status(self):
+        with self.assertRaises(RequestError) as raised:
+            self.api.details("com.example.app")
+        self.assertEqual(raised.exception.status, 429)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from apkfetch import apkfetch as fetch
+from apkfetch import jobs
+from googleplay_api.googleplay import GooglePlayAPI, RequestError
+from googleplay_api.mockserver import MockPlayServer
+
+class WorkLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "jobs.sqlite")
+        self.worklog = jobs.WorkLog(self.path)
+        self.calls = {}
+
+    def tearDown(self):
+        self.worklog.close()
+        shutil.rmtree(self.dir)
+
+    def run_jobs(self, errors):
+        # errors: {package: exception raised on every attempt}
+        def handler(package):
+            self.calls[package] = self.calls.get(package, 0) + 1
+            if package in errors:
+                raise errors[package]
+        self.worklog.add(["ok"] + sorted(errors))
+        return jobs.JobRunner(self.worklog, handler, owner="test").run()
+
+    def test_attempt_limits_per_error_class(self):
+        counts = self.run_jobs({"unlisted": AssertionError("Store listing unavailable"),
+                                "notfound": RequestError("Not found", status=404),
+                                "throttled": RequestError("Too many requests", status=429),
+                                "broken": RequestError("Server error", status=500)})
+        self.assertEqual(self.calls, {"ok": 1, "unlisted": 1, "notfound": 1, "throttled": 10, "broken": 3})
+        self.assertEqual(counts[jobs.DONE], 1)
+        self.assertEqual(counts[jobs.FAILED], 4)
+        self.assertEqual([(package, attempts, cls) for (package, attempts, cls, _) in self.worklog.failures()],
+                         [("broken", 3, "RequestError/500"), ("notfound", 1, "RequestError/404"),
+                          ("throttled", 10, "RequestError/429"), ("unlisted", 1, "AssertionError")])
+
+    def test_attempt_limit_overrides(self):
+        self.worklog.add(["throttled"])
+        def handler(package):
+            self.calls[package] = self.calls.get(package, 0) + 1
+            raise RequestError("Too many requests", status=429)
+        jobs.JobRunner(self.worklog, handler, owner="test", attempt_limits={"RequestError/429": 2}).run()
+        self.assertEqual(self.calls, {"throttled": 2})
+
+    def test_requeue_stale(self):
+        self.worklog.add(["a", "b", "c"])
+        self.assertEqual(self.worklog.claim("dead", 2), ["a", "b"])
+        # Claimed an hour ago; only "b" has had a heartbeat since
+        with sqlite3.connect(self.path) as db:
+            db.execute("UPDATE jobs SET updated_at = ?", (int(time.time()) - 3600,))
+        self.worklog.touch(["b"])
+
+        self.assertEqual(self.worklog.requeue_stale(60), 1)
+        self.assertIsNone(self.worklog.owner("a"))
+        self.assertEqual(self.worklog.owner("b"), "dead")
+        self.assertEqual(self.worklog.counts()[jobs.PENDING], 2)
+
+    def test_requeue_owner_on_restart(self):
+        self.worklog.add(["a", "b"])
+        self.worklog.claim("test", 1)
+        self.assertEqual(self.run_jobs({}), {jobs.PENDING: 0, jobs.IN_PROGRESS: 0, jobs.DONE: 3, jobs.FAILED: 0})
+
+class DownloadAllTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer(apkSize=10000).start()
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        fetch.api = None
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def test_download_all(self):
+        packages = ["com.example.app%d" % i for i in range(5)]
+        counts = jobs.download_all(os.path.join(self.dir, "jobs.sqlite"), packages, outdir=self.dir)
+        self.assertEqual(counts[jobs.DONE], 5)
+        for package in packages:
+            self.assertTrue(os.path.exists(os.path.join(self.dir, "%s-%d.apk" % (package, self.server.versionCode(package)))))
+
+if __name__ == "__main__":
+    unittest.main()
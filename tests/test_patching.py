@@ -0,0 +1,118 @@
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from apkfetch import apkfetch as fetch
+from apkfetch import apkstore, patching
+from googleplay_api import metrics
+from googleplay_api.googleplay import GooglePlayAPI
+from googleplay_api.mockserver import MockPlayServer
+
+PACKAGE = "com.example.app"
+
+def gdiff(*commands):
+    return patching.GDIFF_MAGIC + struct.pack(">B", patching.GDIFF_VERSION) + b"".join(commands) + b"\x00"
+
+def data(text):
+    return struct.pack(">B", len(text)) + text
+
+def copy(offset, length):
+    return struct.pack(">BiH", 253, offset, length)
+
+class GdiffTest(unittest.TestCase):
+    def apply(self, base, patch, chunkSize=3):
+        chunks = [patch[i:i + chunkSize] for i in range(0, len(patch), chunkSize)]
+        return b"".join(patching.apply_gdiff(io.BytesIO(base), chunks))
+
+    def test_data_and_copy(self):
+        patch = gdiff(copy(6, 5), data(b", hello "), copy(0, 5))
+        self.assertEqual(self.apply(b"hello world", patch), b"world, hello hello")
+
+    def test_short_patch(self):
+        patch = gdiff(copy(0, 5))
+        with self.assertRaises(patching.PatchError):
+            self.apply(b"hello world", patch[:-3])
+
+    def test_not_a_patch(self):
+        with self.assertRaises(patching.PatchError):
+            self.apply(b"hello world", b"PK\x03\x04 not a patch")
+
+    def test_copy_past_end_of_base(self):
+        with self.assertRaises(patching.PatchError):
+            self.apply(b"hello", gdiff(copy(3, 10)))
+
+    def test_limit_chunks(self):
+        with self.assertRaises(patching.PatchError):
+            list(patching.limit_chunks([b"abc", b"def"], 5))
+        self.assertEqual(list(patching.limit_chunks([b"abc", b"def"], 6)), [b"abc", b"def"])
+
+class DeltaDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockPlayServer(apkSize=200000, patches=True).start()
+        fetch.api = self.server.configure(GooglePlayAPI(androidId="0"))
+        fetch.api.login(authSubToken="mock")
+        self.dir = tempfile.mkdtemp()
+        metrics.REGISTRY.reset()
+
+        # Hold version 1 to patch from
+        self.base = fetch.get_apk(PACKAGE, 1, outdir=self.dir)
+
+    def tearDown(self):
+        fetch.api = None
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def deltaDownloads(self, result):
+        return metrics.REGISTRY.counters.get(("delta_downloads_total", (("result", result),)), 0)
+
+    def assertDownloaded(self, path, result):
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.server.apk(PACKAGE, 2))
+        self.assertEqual(self.deltaDownloads(result), 1)
+
+    def test_patched(self):
+        self.assertDownloaded(fetch.get_apk(PACKAGE, 2, outdir=self.dir, delta=True), "patched")
+
+    def test_patched_into_store(self):
+        store = apkstore.ApkStore(os.path.join(self.dir, "store"))
+        try:
+            fetch.get_apk(PACKAGE, 1, store=store)
+            self.assertDownloaded(fetch.get_apk(PACKAGE, 2, store=store, delta=True), "patched")
+        finally:
+            store.close()
+
+    def test_short_patch_falls_back(self):
+        patch = self.server.patch
+        self.server.patch = lambda *args: patch(*args)[:-1000]
+        self.assertDownloaded(fetch.get_apk(PACKAGE, 2, outdir=self.dir, delta=True), "fallback")
+
+    def test_corrupt_patch_falls_back(self):
+        # Applies cleanly, but the result doesn't match the delivery's signature
+        self.server.patch = lambda *args: gdiff(copy(0, 65535), copy(0, 65535), copy(0, 65535), copy(0, 3395))
+        self.assertDownloaded(fetch.get_apk(PACKAGE, 2, outdir=self.dir, delta=True), "fallback")
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "%s-2.apk.part" % PACKAGE)))
+
+    def test_changed_base_falls_back(self):
+        # Same size, different content: caught by the base signature before the patch is fetched
+        with open(self.base, "r+b") as f:
+            f.write(b"\0" * 100)
+        self.assertDownloaded(fetch.get_apk(PACKAGE, 2, outdir=self.dir, delta=True), "fallback")
+
+    def test_oversized_patch_falls_back(self):
+        # The patch served grows past the maxPatchSize of the purchase
+        patch = self.server.patch
+        self.server.patch = lambda *args: patch(*args) + b"\0" * 100
+        purchase = self.server.respond
+        def respond(method, path, query, body):
+            wrapper = purchase(method, path, query, body)
+            if path == "purchase":
+                wrapper.payload.buyResponse.purchaseStatusResponse.appDeliveryData.patchData.maxPatchSize -= 100
+            return wrapper
+        self.server.respond = respond
+        self.assertDownloaded(fetch.get_apk(PACKAGE, 2, outdir=self.dir, delta=True), "fallback")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import unittest
+
+import requests
+
+try:
+    # Python 2
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    # Python 3
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from apkfetch import publicmeta
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    # Answers /<status>?id=<package> with that status
+    def do_GET(self):
+        status = int(self.path[1:].split("?")[0])
+        body = b"<html><body>%d</body></html>" % status if status != 204 else b""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FetchAppPageTest(unittest.TestCase):
+    def setUp(self):
+        self.httpd = HTTPServer(("127.0.0.1", 0), _StatusHandler)
+        thread = threading.Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def fetch(self, status):
+        url = "http://127.0.0.1:%d/%d?id=%%s" % (self.httpd.server_address[1], status)
+        return publicmeta.fetch_app_page("com.example.app", base_url=url)
+
+    def test_ok(self):
+        self.assertEqual(self.fetch(200), (b"<html><body>200</body></html>", True))
+
+    def test_error_status_raises(self):
+        for status in (404, 429, 500):
+            with self.assertRaises(requests.HTTPError) as raised:
+                self.fetch(status)
+            self.assertEqual(raised.exception.response.status_code, status)
+
+    def test_unexpected_status_raises(self):
+        with self.assertRaises(requests.HTTPError) as raised:
+            self.fetch(204)
+        self.assertEqual(raised.exception.response.status_code, 204)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,22 @@
+import shutil
+import tempfile
+import unittest
+
+from apkfetch import apkfetch as fetch
+from apkfetch import pagearchive
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.archive = pagearchive.PageArchive(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unparseable_pages_are_skipped(self):
+        self.archive.put("com.example.a", b"<html><body>Not a store page</body></html>")
+        self.archive.put("com.example.b", b"")
+        self.assertEqual(list(fetch.replay_public_metadata(self.dir)), [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from apkfetch import snapshot
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_duplicates_keep_highest_version(self):
+        path = os.path.join(self.dir, "snapshot.gz")
+        count = snapshot.write_snapshot(path, [("com.b", 5, None), ("com.a", 3, 100), ("com.a", 7, 200), ("com.a", 5, 300)])
+        self.assertEqual(count, 2)
+        self.assertEqual(list(snapshot.read_snapshot(path)), [("com.a", 7, 200), ("com.b", 5, None)])
+
+    def test_diff(self):
+        old = os.path.join(self.dir, "old")
+        new = os.path.join(self.dir, "new")
+        snapshot.write_snapshot(old, [("com.a", 1, None), ("com.b", 1, None), ("com.c", 1, None)])
+        snapshot.write_snapshot(new, [("com.b", 2, None), ("com.c", 1, None), ("com.d", 1, None)])
+        self.assertEqual(list(snapshot.diff_snapshots(old, new)),
+                         [("removed", "com.a", 1, None), ("changed", "com.b", 1, 2), ("added", "com.d", None, 1)])
+
+if __name__ == "__main__":
+    unittest.main()